@@ -0,0 +1,236 @@
+"""
+Credits ledger and usage billing for plan-based VPSes (v3.py).
+
+- CreditLedger: balances live in memory. Every change is appended as one JSON
+  line to `<credits>.ledger`; the full balance table is only rewritten to
+  `credits.json` when the ledger is compacted (every `compact_every` entries),
+  so a billing tick costs one small append instead of a full JSON rewrite.
+- UsageMeter: tracks how long each VPS has been running, fed by container
+  state events (start / die) and by the bot's own start/stop actions.
+- BillingEngine.sweep(): converts metered seconds into credits using the
+  plan price, posts one ledger entry per user and returns the running VPSes
+  whose owner is out of credits so the caller can suspend them.
+
+Plan prices (VPS_PLANS[plan][cpu_type]) are credits per BILLING_PERIOD_SECONDS.
+"""
+
+import json
+import os
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from vps_records import VPSRecord, VPSStore
+
+BILLING_PERIOD_SECONDS = 30 * 24 * 3600
+LEDGER_SCHEMA = 1
+
+
+class InsufficientCredits(PermissionError):
+    """The user's balance does not cover the requested operation."""
+
+
+class CreditLedger:
+    def __init__(self, path, compact_every: int = 10000):
+        self.path = Path(path)
+        self.ledger_path = self.path.with_suffix(".ledger")
+        self.compact_every = compact_every
+        self.balances: Dict[int, float] = {}
+        self.seq = 0
+        self._uncompacted = 0
+        damaged = self.load()
+        self._log = open(self.ledger_path, "a")
+        if damaged:
+            # never append after a torn line: the next entry would be glued onto it
+            # and lost on the following load. The snapshot captures everything read.
+            self.compact()
+
+    def load(self) -> bool:
+        """Load snapshot + ledger; returns True if the ledger had unreadable lines."""
+        snapshot_seq = 0
+        if self.path.exists():
+            raw = json.loads(self.path.read_text() or "{}")
+            if "schema" in raw:
+                snapshot_seq = raw.get("seq", 0)
+                balances = raw.get("balances", {})
+            else:
+                # legacy credits.json: {"<user id>": amount}
+                balances = raw
+            self.balances = {int(uid): float(amount) for uid, amount in balances.items()}
+        self.seq = snapshot_seq
+        damaged = 0
+        if self.ledger_path.exists():
+            with open(self.ledger_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        damaged += 1  # torn write from a crash
+                        continue
+                    if not line.endswith("\n"):
+                        damaged += 1  # complete entry, but the newline never made it to disk
+                    if entry["s"] <= snapshot_seq:
+                        continue
+                    self.balances[entry["u"]] = self.balances.get(entry["u"], 0.0) + entry["d"]
+                    self.seq = entry["s"]
+                    self._uncompacted += 1
+        if damaged:
+            print(f"[!] {self.ledger_path}: {damaged} torn/unreadable line(s), compacting the ledger")
+        return bool(damaged)
+
+    def balance(self, user_id: int) -> float:
+        return self.balances.get(user_id, 0.0)
+
+    def post(self, entries: Iterable[Tuple[int, float, str]]):
+        """Append (user_id, delta, reason) entries with a single write."""
+        now = int(time.time())
+        lines = []
+        for user_id, delta, reason in entries:
+            self.seq += 1
+            self.balances[user_id] = self.balances.get(user_id, 0.0) + delta
+            lines.append(json.dumps({"s": self.seq, "t": now, "u": user_id, "d": round(delta, 6), "r": reason},
+                                    separators=(",", ":")))
+        if not lines:
+            return
+        self._log.write("\n".join(lines) + "\n")
+        self._log.flush()
+        self._uncompacted += len(lines)
+        if self._uncompacted >= self.compact_every:
+            self.compact()
+
+    def credit(self, user_id: int, amount: float, reason: str = "topup"):
+        self.post([(user_id, amount, reason)])
+
+    def debit(self, user_id: int, amount: float, reason: str):
+        self.post([(user_id, -amount, reason)])
+
+    def compact(self):
+        """Write the balance snapshot, then start a fresh ledger."""
+        payload = {"schema": LEDGER_SCHEMA, "seq": self.seq,
+                   "balances": {str(uid): round(bal, 6) for uid, bal in self.balances.items()}}
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent or ".", prefix=self.path.name, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(payload, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        # entries up to `seq` are now in the snapshot; a crash before the
+        # truncate below is harmless because load() skips them by seq
+        self._log.close()
+        self._log = open(self.ledger_path, "w")
+        self._uncompacted = 0
+
+    def close(self):
+        self.compact()
+        self._log.close()
+
+
+class UsageMeter:
+    def __init__(self):
+        self._running_since: Dict[str, float] = {}
+        self._unbilled: Dict[str, float] = defaultdict(float)
+
+    def on_state(self, vps_id: str, running: bool, ts: Optional[float] = None):
+        ts = time.time() if ts is None else ts
+        if running:
+            self._running_since.setdefault(vps_id, ts)
+            return
+        since = self._running_since.pop(vps_id, None)
+        if since is not None and ts > since:
+            self._unbilled[vps_id] += ts - since
+
+    def pop_unbilled(self, vps_id: str) -> float:
+        return self._unbilled.pop(vps_id, 0.0)
+
+    def forget(self, vps_id: str):
+        self._running_since.pop(vps_id, None)
+        self._unbilled.pop(vps_id, None)
+
+    def is_running(self, vps_id: str) -> bool:
+        return vps_id in self._running_since
+
+    def collect(self, now: Optional[float] = None) -> Dict[str, float]:
+        """Return {vps_id: seconds run since the last collect} and reset."""
+        now = time.time() if now is None else now
+        usage = self._unbilled
+        self._unbilled = defaultdict(float)
+        for vps_id, since in self._running_since.items():
+            if now > since:
+                usage[vps_id] += now - since
+                self._running_since[vps_id] = now
+        return usage
+
+
+class BillingEngine:
+    def __init__(self, store: VPSStore, ledger: CreditLedger, plans: dict, meter: Optional[UsageMeter] = None):
+        self.store = store
+        self.ledger = ledger
+        self.plans = plans
+        self.meter = meter or UsageMeter()
+        self._by_container: Dict[str, str] = {}
+        self._index_revision = -1
+
+    def rate_per_second(self, rec: VPSRecord) -> float:
+        plan = self.plans.get(rec.plan)
+        if not plan or rec.cpu_type not in plan:
+            return 0.0
+        return plan[rec.cpu_type] / BILLING_PERIOD_SECONDS
+
+    def is_billed(self, rec: VPSRecord) -> bool:
+        return self.rate_per_second(rec) > 0
+
+    def monthly_commitment(self, user_id: int) -> float:
+        """Credits per billing period for all of the user's billed VPSes, running or not."""
+        return sum(self.rate_per_second(rec) for rec in self.store if rec.owner == user_id) * BILLING_PERIOD_SECONDS
+
+    def start_metering(self, now: Optional[float] = None):
+        """Seed the meter with every billed VPS the store says is running."""
+        for rec in self.store:
+            if rec.status == "running" and self.is_billed(rec):
+                self.meter.on_state(rec.id, True, now)
+
+    def vps_for_container(self, name_or_id: str) -> Optional[str]:
+        if self._index_revision != self.store.revision:
+            self._by_container = {rec.container_ref: rec.id for rec in self.store}
+            self._index_revision = self.store.revision
+        return self._by_container.get(name_or_id)
+
+    def on_container_event(self, name: str, action: str, ts: Optional[float] = None):
+        vps_id = self.vps_for_container(name)
+        if vps_id is None:
+            return
+        if action == "start":
+            self.meter.on_state(vps_id, True, ts)
+        elif action in ("die", "stop", "kill", "destroy"):
+            self.meter.on_state(vps_id, False, ts)
+
+    def finalize(self, rec: VPSRecord, now: Optional[float] = None):
+        """Bill whatever `rec` has run since the last sweep and stop metering it (call before deleting)."""
+        self.meter.on_state(rec.id, False, now)
+        seconds = self.meter.pop_unbilled(rec.id)
+        amount = seconds * self.rate_per_second(rec)
+        if amount > 0:
+            self.ledger.debit(rec.owner, amount, "usage")
+
+    def sweep(self, now: Optional[float] = None) -> List[VPSRecord]:
+        """Bill metered usage; return running billed VPSes whose owner is now out of credits."""
+        usage = self.meter.collect(now)
+        per_user: Dict[int, float] = defaultdict(float)
+        billed: List[VPSRecord] = []
+        for vps_id, seconds in usage.items():
+            rec = self.store.get(vps_id)
+            if rec is None:
+                self.meter.forget(vps_id)
+                continue
+            rate = self.rate_per_second(rec)
+            if rate <= 0:
+                continue
+            per_user[rec.owner] += seconds * rate
+            billed.append(rec)
+        self.ledger.post((uid, -amount, "usage") for uid, amount in per_user.items() if amount > 0)
+        return [rec for rec in billed
+                if self.meter.is_running(rec.id) and self.ledger.balance(rec.owner) <= 0]
@@ -0,0 +1,110 @@
+"""
+Per-VPS credential provisioning at container create time.
+
+Instead of exec'ing chpasswd into a running container and restarting sshd,
+the bot writes a small directory per container on the host:
+
+    <CREDENTIALS_DIR>/<container name>/
+        root.hash         SHA-512 crypt hash of the root password
+        authorized_keys   optional SSH public key(s)
+        init.sh           entrypoint: installs the hash, then execs sshd
+
+and bind-mounts it read-only at /etc/vps-credentials. init.sh runs before
+sshd starts. On a writable root it rewrites /etc/shadow in place. Base images
+built for read-only roots link /etc/shadow to /run/vps/shadow (tmpfs), which
+init.sh generates (READ_ONLY_SHADOW_SETUP). If it can do neither, init.sh
+exits instead of starting sshd with the image's own root password. Public keys
+are read straight from the mount via AuthorizedKeysFile, so they work on any
+image.
+
+sshd's StrictModes requires authorized_keys to be owned by root, so the bot
+has to run as root (it already needs Docker access).
+"""
+
+import os
+import secrets
+import shutil
+import subprocess
+import warnings
+from pathlib import Path
+from typing import Optional
+
+CREDENTIALS_DIR = Path("vps_credentials")
+MOUNT_POINT = "/etc/vps-credentials"
+INIT_COMMAND = ["/bin/sh", f"{MOUNT_POINT}/init.sh"]
+
+# Lines for a base image Dockerfile so the password can be installed under read_only=True
+READ_ONLY_SHADOW_SETUP = "cp /etc/shadow /etc/shadow.base && ln -sf /run/vps/shadow /etc/shadow"
+
+INIT_SCRIPT = f"""#!/bin/sh
+# Generated by the VPS bot: install credentials from {MOUNT_POINT}, then run sshd.
+CRED={MOUNT_POINT}
+mkdir -p /run/sshd /run/vps
+if [ -s "$CRED/root.hash" ]; then
+    SRC=/etc/shadow
+    [ -f /etc/shadow.base ] && SRC=/etc/shadow.base
+    {{ grep -v '^root:' "$SRC" || true; printf 'root:%s:19000:0:99999:7:::\\n' "$(cat "$CRED/root.hash")"; }} > /run/vps/shadow
+    chmod 600 /run/vps/shadow
+    if [ "$(readlink /etc/shadow)" != /run/vps/shadow ] && ! cat /run/vps/shadow > /etc/shadow; then
+        echo "vps-init: cannot install the root password: /etc/shadow is read-only and not linked to /run/vps/shadow" >&2
+        exit 1
+    fi
+fi
+exec /usr/sbin/sshd -D -e -o "AuthorizedKeysFile=.ssh/authorized_keys $CRED/authorized_keys"
+"""
+
+_KEY_TYPES = ("ssh-ed25519", "ssh-rsa", "ecdsa-sha2-", "sk-ssh-ed25519@openssh.com", "sk-ecdsa-sha2-")
+
+
+def valid_public_key(key: str) -> bool:
+    parts = key.strip().split()
+    return len(parts) >= 2 and "\n" not in key.strip() and parts[0].startswith(_KEY_TYPES)
+
+
+def hash_password(password: str) -> str:
+    """SHA-512 crypt ($6$) hash, as used in /etc/shadow."""
+    salt = secrets.token_hex(8)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            import crypt  # stdlib up to Python 3.12
+        return crypt.crypt(password, f"$6${salt}$")
+    except ImportError:
+        out = subprocess.run(["openssl", "passwd", "-6", "-salt", salt, "-stdin"],
+                             input=password, capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+
+
+def _credentials_dir(container_name: str, base_dir: Path) -> Path:
+    base = Path(base_dir).resolve()
+    cred_dir = (base / container_name).resolve()
+    if cred_dir.parent != base:
+        raise ValueError(f"invalid container name for a credentials directory: {container_name!r}")
+    return cred_dir
+
+
+def write_credentials(container_name: str, password: Optional[str] = None,
+                      authorized_keys: Optional[str] = None, base_dir: Path = CREDENTIALS_DIR) -> Path:
+    """Create the credentials directory for a container and return its absolute path."""
+    cred_dir = _credentials_dir(container_name, base_dir)
+    cred_dir.mkdir(parents=True, exist_ok=True, mode=0o700)
+    if password:
+        hash_file = cred_dir / "root.hash"
+        hash_file.write_text(hash_password(password))
+        os.chmod(hash_file, 0o600)
+    keys_file = cred_dir / "authorized_keys"
+    keys_file.write_text((authorized_keys.strip() + "\n") if authorized_keys else "")
+    os.chmod(keys_file, 0o644)
+    init_file = cred_dir / "init.sh"
+    init_file.write_text(INIT_SCRIPT)
+    os.chmod(init_file, 0o755)
+    return cred_dir
+
+
+def credential_volumes(cred_dir: Path) -> dict:
+    """`volumes=` argument for containers.run()."""
+    return {str(cred_dir): {"bind": MOUNT_POINT, "mode": "ro"}}
+
+
+def remove_credentials(container_name: str, base_dir: Path = CREDENTIALS_DIR):
+    shutil.rmtree(_credentials_dir(container_name, base_dir), ignore_errors=True)
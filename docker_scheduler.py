@@ -0,0 +1,216 @@
+"""
+Docker operation scheduler shared by the VPS bots.
+
+Every Docker call made on behalf of a user goes through DockerScheduler:
+- per-user and per-VPS token buckets reject spam before it reaches the daemon
+- operations are queued in priority lanes (admin > create/delete > user)
+- inside a lane, users are served by weighted fair queuing so one busy user
+  cannot starve everyone else
+- identical pending operations (same VPS + same action) collapse into one
+
+The blocking docker-py call itself runs in the default executor, with at most
+`max_concurrency` calls in flight against the daemon at any time.
+
+Per-user / per-VPS state is dropped once it carries no information (a bucket
+that has refilled, a fair-queuing tag of a lane that has drained), checked at
+most every `prune_interval` seconds, so it does not grow with every user and
+VPS ever seen.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+# Lanes, lower value is served first
+LANE_ADMIN = 0
+LANE_LIFECYCLE = 1   # create / delete
+LANE_USER = 2
+
+
+class RateLimited(Exception):
+    """Raised by submit() when a user or VPS bucket is empty."""
+
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"rate limited ({scope}), retry in {retry_after:.1f}s")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def peek(self, cost: float = 1.0) -> float:
+        """Seconds until `cost` tokens are available (0 if available now)."""
+        self._refill(time.monotonic())
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def take(self, cost: float = 1.0):
+        self._refill(time.monotonic())
+        self.tokens -= cost
+
+    def is_full(self, now: float) -> bool:
+        """A full bucket behaves exactly like a new one, so it can be dropped."""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class _Op:
+    __slots__ = ("lane", "start", "finish", "seq", "fn", "future", "key")
+
+    def __init__(self, lane: int, start: float, finish: float, seq: int, fn: Callable[[], Any],
+                 future: asyncio.Future, key: Optional[Tuple[Hashable, str]]):
+        self.lane = lane
+        self.start = start
+        self.finish = finish
+        self.seq = seq
+        self.fn = fn
+        self.future = future
+        self.key = key
+
+    def __lt__(self, other: "_Op") -> bool:
+        return (self.lane, self.finish, self.seq) < (other.lane, other.finish, other.seq)
+
+
+class DockerScheduler:
+    def __init__(self,
+                 max_concurrency: int = 4,
+                 user_rate: float = 0.5, user_burst: float = 5,
+                 vps_rate: float = 0.2, vps_burst: float = 3,
+                 prune_interval: float = 60.0):
+        self.max_concurrency = max_concurrency
+        self.user_rate, self.user_burst = user_rate, user_burst
+        self.vps_rate, self.vps_burst = vps_rate, vps_burst
+        self._user_buckets: Dict[int, TokenBucket] = {}
+        self._vps_buckets: Dict[Hashable, TokenBucket] = {}
+        self._heap: List[_Op] = []
+        self._pending: Dict[Tuple[Hashable, str], _Op] = {}
+        # WFQ state: per-(lane, user) last finish tag and per-lane virtual clock
+        self._last_finish: Dict[Tuple[int, int], float] = {}
+        self._vclock: Dict[int, float] = {}
+        self._seq = itertools.count()
+        self.prune_interval = prune_interval
+        self._last_prune = time.monotonic()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+
+    # ---------------- rate limiting ----------------
+    def _bucket(self, table: dict, key, rate: float, burst: float) -> TokenBucket:
+        bucket = table.get(key)
+        if bucket is None:
+            bucket = table[key] = TokenBucket(rate, burst)
+        return bucket
+
+    def _charge(self, user_id: int, vps_key: Optional[Hashable]):
+        user_bucket = self._bucket(self._user_buckets, user_id, self.user_rate, self.user_burst)
+        wait = user_bucket.peek()
+        if wait:
+            raise RateLimited("user", wait)
+        vps_bucket = None
+        if vps_key is not None:
+            vps_bucket = self._bucket(self._vps_buckets, vps_key, self.vps_rate, self.vps_burst)
+            wait = vps_bucket.peek()
+            if wait:
+                raise RateLimited("vps", wait)
+        # only take once both checks passed so a rejected call costs nothing
+        user_bucket.take()
+        if vps_bucket is not None:
+            vps_bucket.take()
+
+    def _prune(self, now: float):
+        for table in (self._user_buckets, self._vps_buckets):
+            for key in [k for k, bucket in table.items() if bucket.is_full(now)]:
+                del table[key]
+        # nothing queued in a lane: move its clock past every finish tag so the tags can go
+        busy = {op.lane for op in self._heap}
+        for (lane, _), finish in self._last_finish.items():
+            if lane not in busy:
+                self._vclock[lane] = max(self._vclock.get(lane, 0.0), finish)
+        # a finish tag at or behind the lane clock gives the same start tag as no tag at all
+        for key in [k for k, finish in self._last_finish.items() if finish <= self._vclock.get(k[0], 0.0)]:
+            del self._last_finish[key]
+        self._last_prune = now
+
+    # ---------------- queueing ----------------
+    def _start(self):
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)]
+
+    def submit(self, fn: Callable[[], Any], *, user_id: int,
+               vps_key: Optional[Hashable] = None, action: Optional[str] = None,
+               lane: int = LANE_USER, weight: float = 1.0, charge: bool = True) -> "asyncio.Future":
+        """
+        Queue blocking `fn` and return an awaitable for its result.
+
+        `action` enables coalescing: while an op with the same (vps_key, action)
+        is still queued, later submissions share its result instead of queueing
+        another Docker call. Pass action=None for ops that must always run
+        (exec, create). Admin-lane submissions, and callers passing
+        charge=False (work the bot itself already admitted), skip the rate limits.
+        """
+        self._start()
+        key = (vps_key, action) if (vps_key is not None and action) else None
+        if key is not None and key in self._pending:
+            return asyncio.shield(self._pending[key].future)
+
+        now = time.monotonic()
+        if now - self._last_prune >= self.prune_interval:
+            self._prune(now)
+        if charge and lane != LANE_ADMIN:
+            self._charge(user_id, vps_key)
+
+        vclock = self._vclock.get(lane, 0.0)
+        start = max(vclock, self._last_finish.get((lane, user_id), 0.0))
+        finish = start + 1.0 / max(weight, 1e-6)
+        self._last_finish[(lane, user_id)] = finish
+
+        future = asyncio.get_running_loop().create_future()
+        op = _Op(lane, start, finish, next(self._seq), fn, future, key)
+        heapq.heappush(self._heap, op)
+        if key is not None:
+            self._pending[key] = op
+        self._wakeup.set()
+        return asyncio.shield(future)
+
+    async def run(self, fn: Callable[[], Any], **kwargs) -> Any:
+        return await self.submit(fn, **kwargs)
+
+    def queue_depth(self) -> int:
+        return len(self._heap)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            op = heapq.heappop(self._heap)
+            # advance the lane's virtual clock to the tag being served
+            self._vclock[op.lane] = max(self._vclock.get(op.lane, 0.0), op.start)
+            if op.key is not None:
+                self._pending.pop(op.key, None)
+            if op.future.cancelled():
+                continue
+            try:
+                result = await loop.run_in_executor(None, op.fn)
+            except Exception as e:
+                if not op.future.done():
+                    op.future.set_exception(e)
+            else:
+                if not op.future.done():
+                    op.future.set_result(result)
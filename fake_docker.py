@@ -0,0 +1,175 @@
+"""
+In-memory stand-in for docker.DockerClient, covering the calls the bots make.
+
+Containers "run" instantly and never execute anything; exec_run() returns
+(0, b""). Used by `python http_api.py` and by the bots when VPS_FAKE_DOCKER=1
+is set, so the API and commands can be exercised without a Docker daemon.
+"""
+
+import queue
+import secrets
+import time
+from typing import Dict, List, Optional
+
+from docker.errors import ImageNotFound, NotFound
+
+
+class FakeContainer:
+    def __init__(self, client: "FakeDockerClient", image: str, name: str, **kwargs):
+        self.client = client
+        self.id = secrets.token_hex(32)
+        self.short_id = self.id[:12]
+        self.name = name
+        self.image = image
+        self.kwargs = kwargs
+        self.status = "created"
+        ports = {}
+        for container_port, host_port in (kwargs.get("ports") or {}).items():
+            ports[container_port] = [{"HostIp": "0.0.0.0", "HostPort": str(host_port)}]
+        self.attrs = {
+            "Id": self.id,
+            "Name": f"/{name}",
+            "State": {"Status": self.status},
+            "NetworkSettings": {"Ports": ports},
+        }
+
+    @property
+    def ports(self) -> dict:
+        return self.attrs["NetworkSettings"]["Ports"]
+
+    def _set(self, status: str, event: str):
+        self.status = status
+        self.attrs["State"]["Status"] = status
+        self.client._emit(self, event)
+
+    def reload(self):
+        pass
+
+    def start(self):
+        self._set("running", "start")
+
+    def stop(self, timeout: int = 10):
+        if self.status == "running":
+            self._set("exited", "die")
+
+    def restart(self, timeout: int = 10):
+        self.stop()
+        self.start()
+
+    def remove(self, force: bool = False):
+        if self.status == "running" and not force:
+            raise RuntimeError("cannot remove a running container without force")
+        self.client._containers.pop(self.id, None)
+        self.client._emit(self, "destroy")
+
+    def exec_run(self, cmd, **kwargs):
+        if kwargs.get("demux"):
+            return 0, (b"", b"")
+        return 0, b""
+
+
+class FakeImage:
+    def __init__(self, tag: str, size: int = 100 * 1024 * 1024):
+        self.id = "sha256:" + secrets.token_hex(32)
+        self.tags = [tag]
+        self.attrs = {"Id": self.id, "RepoTags": [tag], "Size": size}
+
+
+class _Containers:
+    def __init__(self, client: "FakeDockerClient"):
+        self.client = client
+
+    def run(self, image: str, command=None, name: Optional[str] = None, detach: bool = False, **kwargs):
+        self.client.images.get(image)
+        name = name or f"fake_{secrets.token_hex(4)}"
+        cont = FakeContainer(self.client, image, name, command=command, **kwargs)
+        self.client._containers[cont.id] = cont
+        cont.start()
+        return cont
+
+    def get(self, id_or_name: str) -> FakeContainer:
+        for cont in self.client._containers.values():
+            if cont.id.startswith(id_or_name) or cont.name == id_or_name:
+                return cont
+        raise NotFound(f"No such container: {id_or_name}")
+
+    def list(self, all: bool = False, **kwargs) -> List[FakeContainer]:
+        return [c for c in self.client._containers.values() if all or c.status == "running"]
+
+
+class _Images:
+    def __init__(self, client: "FakeDockerClient"):
+        self.client = client
+
+    def get(self, name: str) -> FakeImage:
+        if name not in self.client._images:
+            raise ImageNotFound(f"No such image: {name}")
+        return self.client._images[name]
+
+    def pull(self, repository: str, tag: Optional[str] = None, **kwargs) -> FakeImage:
+        ref = f"{repository}:{tag}" if tag else repository
+        self.client._images[ref] = FakeImage(ref)
+        return self.client._images[ref]
+
+    def build(self, path: str = None, tag: str = None, **kwargs):
+        self.client._images[tag] = FakeImage(tag)
+        return self.client._images[tag], []
+
+    def list(self, **kwargs) -> List[FakeImage]:
+        return list(self.client._images.values())
+
+    def remove(self, image: str, force: bool = False, **kwargs):
+        if self.client._images.pop(image, None) is None:
+            raise ImageNotFound(f"No such image: {image}")
+
+
+class _Networks:
+    def __init__(self, client: "FakeDockerClient"):
+        self.client = client
+
+    def get(self, name: str):
+        if name not in self.client._networks:
+            raise NotFound(f"network {name} not found")
+        return self.client._networks[name]
+
+    def create(self, name: str, **kwargs):
+        net = type("FakeNetwork", (), {})()
+        net.name = name
+        net.attrs = {"Name": name, "Containers": {}}
+        self.client._networks[name] = net
+        return net
+
+
+class FakeDockerClient:
+    def __init__(self, images: Optional[List[str]] = None):
+        self._containers: Dict[str, FakeContainer] = {}
+        self._images: Dict[str, FakeImage] = {}
+        self._networks: Dict[str, object] = {}
+        self._event_queues: List[queue.Queue] = []
+        self.containers = _Containers(self)
+        self.images = _Images(self)
+        self.networks = _Networks(self)
+        for ref in images or ["fake"]:
+            self.images.pull(ref)
+
+    def _emit(self, cont: FakeContainer, action: str):
+        event = {"Type": "container", "Action": action, "id": cont.id, "time": int(time.time()),
+                 "Actor": {"ID": cont.id, "Attributes": {"name": cont.name, "image": cont.image}}}
+        for q in self._event_queues:
+            q.put(event)
+
+    def events(self, decode: bool = False, filters: Optional[dict] = None, since=None):
+        """Blocking generator like docker-py's; honours the `event` filter only (no replay for `since`)."""
+        wanted = set((filters or {}).get("event", []))
+        q: queue.Queue = queue.Queue()
+        self._event_queues.append(q)
+        try:
+            while True:
+                event = q.get()
+                if not wanted or event["Action"] in wanted:
+                    yield event
+        finally:
+            self._event_queues.remove(q)
+
+    def ping(self) -> bool:
+        return True
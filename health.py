@@ -0,0 +1,105 @@
+"""
+SSH readiness probes and fleet health checks.
+
+probe_ssh() opens a TCP connection and requires an "SSH-" identification
+banner, so a listening-but-broken port does not count as healthy.
+wait_for_ssh() retries with exponential backoff (plus jitter) until a deadline
+and is used on the create path so "VPS created" is only reported once sshd
+really answers. HealthMonitor runs periodic checks across all VPSes with a
+bounded number of concurrent probes and keeps the latest result per VPS.
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+
+@dataclass(slots=True)
+class HealthResult:
+    ok: bool
+    checked_at: float
+    latency_ms: float = 0.0
+    banner: str = ""
+    error: str = ""
+
+    def describe(self) -> str:
+        if self.ok:
+            return f"✅ SSH up ({self.latency_ms:.0f} ms, {self.banner})"
+        return f"❌ SSH down ({self.error})"
+
+
+async def probe_ssh(host: str, port: int = 22, timeout: float = 3.0) -> HealthResult:
+    start = time.monotonic()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        try:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+    except (OSError, asyncio.TimeoutError) as e:
+        return HealthResult(False, time.time(), error=str(e) or type(e).__name__)
+    latency = (time.monotonic() - start) * 1000
+    banner = line.decode("ascii", errors="replace").strip()
+    if not banner.startswith("SSH-"):
+        return HealthResult(False, time.time(), latency, banner, error="no SSH banner")
+    return HealthResult(True, time.time(), latency, banner)
+
+
+async def wait_for_ssh(host: str, port: int = 22, deadline: float = 60.0,
+                       initial_delay: float = 0.5, max_delay: float = 5.0,
+                       timeout: float = 3.0) -> HealthResult:
+    """Probe until SSH answers or `deadline` seconds pass; returns the last result."""
+    give_up = time.monotonic() + deadline
+    delay = initial_delay
+    while True:
+        result = await probe_ssh(host, port, timeout)
+        remaining = give_up - time.monotonic()
+        if result.ok or remaining <= 0:
+            return result
+        await asyncio.sleep(min(remaining, delay * random.uniform(0.8, 1.2)))
+        delay = min(delay * 2, max_delay)
+
+
+class HealthMonitor:
+    def __init__(self, concurrency: int = 32, timeout: float = 3.0):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.results: Dict[str, HealthResult] = {}
+
+    def get(self, vps_id: str) -> Optional[HealthResult]:
+        return self.results.get(vps_id)
+
+    def record(self, vps_id: str, result: HealthResult):
+        self.results[vps_id] = result
+
+    def forget(self, vps_id: str):
+        self.results.pop(vps_id, None)
+
+    async def check(self, vps_id: str, host: str, port: int = 22) -> HealthResult:
+        result = await probe_ssh(host, port, self.timeout)
+        self.results[vps_id] = result
+        return result
+
+    async def check_all(self, targets: Iterable[Tuple[str, str, int]]) -> int:
+        """
+        Probe every (vps_id, host, port) with at most `concurrency` probes in
+        flight; returns how many were unhealthy. Targets are consumed lazily by
+        a fixed pool of workers, so the fleet size does not matter.
+        """
+        targets = iter(targets)
+        unhealthy = 0
+
+        async def worker():
+            nonlocal unhealthy
+            for vps_id, host, port in targets:
+                if not (await self.check(vps_id, host, port)).ok:
+                    unhealthy += 1
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return unhealthy
@@ -0,0 +1,251 @@
+"""
+Local REST/JSON control API for the VPS bots (aiohttp, same event loop as the bot).
+
+The API does not talk to Docker itself: each bot passes an ApiBackend wired to
+the same VPSStore, DockerScheduler and create/action/delete coroutines its
+Discord commands use, so both front-ends share one code path.
+
+Auth:   Authorization: Bearer <token>, tokens map to Discord user ids.
+Routes: GET    /api/vps?limit=&offset=   list VPSes visible to the caller (ETag / If-None-Match)
+        POST   /api/vps                  create (body is passed to the bot's create coroutine;
+                                         503 + Retry-After while the image is still being fetched)
+        GET    /api/vps/{id}
+        POST   /api/vps/{id}/{action}    start / stop / restart
+        DELETE /api/vps/{id}
+        GET    /api/stats
+        GET    /api/events               server-sent events for status changes
+
+Errors: 400 bad input, 401 bad token, 403 not allowed, 404 unknown VPS / container,
+        429 rate limited, 503 (+ Retry-After) no capacity / image still being fetched.
+
+Run `python tests/fake_backend.py` for a standalone instance backed by
+fake_docker, handy for trying the API without a Docker daemon or Discord.
+"""
+
+import asyncio
+import hmac
+import json
+import secrets
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+import docker
+from aiohttp import web
+
+from docker_scheduler import DockerScheduler, RateLimited
+from image_catalog import ImageNotReady
+from vps_records import VPSRecord, VPSStore
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+SSE_KEEPALIVE_SECONDS = 15
+RETRY_AFTER_SECONDS = 60
+
+
+class ServiceUnavailable(RuntimeError):
+    """A temporary shortage (no free IPs, host capacity); answered with 503."""
+
+
+class EventHub:
+    """Fan-out of status events to SSE subscribers; slow subscribers drop events."""
+
+    def __init__(self, max_queued: int = 100):
+        self.max_queued = max_queued
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        q = asyncio.Queue(maxsize=self.max_queued)
+        self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue):
+        self._subscribers.discard(q)
+
+    def publish(self, event: dict):
+        for q in self._subscribers:
+            try:
+                q.put_nowait(event)
+            except asyncio.QueueFull:
+                pass
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+
+@dataclass
+class ApiBackend:
+    store: VPSStore
+    scheduler: DockerScheduler
+    events: EventHub
+    is_admin: Callable[[int], bool]
+    # create(user_id, body) -> VPSRecord, or a queued order with .id / .state
+    create: Callable[[int, dict], Awaitable[Any]]
+    # action(record, action, user_id) / delete(record, user_id); raise PermissionError to refuse
+    action: Callable[[VPSRecord, str, int], Awaitable[None]]
+    delete: Callable[[VPSRecord, int], Awaitable[None]]
+    tokens: Dict[str, int] = field(default_factory=dict)
+
+
+def record_json(rec: VPSRecord) -> dict:
+    out = rec.to_dict()
+    out.pop("root_pass", None)
+    return out
+
+
+def _error(status: int, message: str, **extra) -> web.Response:
+    return web.json_response({"error": message, **extra}, status=status)
+
+
+@web.middleware
+async def auth_middleware(request: web.Request, handler):
+    backend: ApiBackend = request.app["backend"]
+    header = request.headers.get("Authorization", "")
+    token = header[7:] if header.startswith("Bearer ") else ""
+    user_id = None
+    for known, uid in backend.tokens.items():
+        if token and hmac.compare_digest(token, known):
+            user_id = uid
+    if user_id is None:
+        return _error(401, "missing or invalid token")
+    request["user_id"] = user_id
+    request["admin"] = backend.is_admin(user_id)
+    try:
+        return await handler(request)
+    except RateLimited as e:
+        return _error(429, str(e), retry_after=e.retry_after)
+    except PermissionError as e:
+        return _error(403, str(e) or "forbidden")
+    except docker.errors.NotFound:
+        return _error(404, "container not found on host")
+    except (ServiceUnavailable, ImageNotReady) as e:
+        return web.json_response({"error": str(e)}, status=503, headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+
+def _visible(request: web.Request, rec: Optional[VPSRecord]) -> bool:
+    return rec is not None and (request["admin"] or rec.can_access(request["user_id"]))
+
+
+def _lookup(request: web.Request) -> VPSRecord:
+    rec = request.app["backend"].store.get(request.match_info["vps_id"])
+    if not _visible(request, rec):
+        raise web.HTTPNotFound(text=json.dumps({"error": "VPS not found"}), content_type="application/json")
+    return rec
+
+
+# ---------------- handlers ----------------
+async def list_vps(request: web.Request) -> web.Response:
+    backend: ApiBackend = request.app["backend"]
+    try:
+        limit = min(int(request.query.get("limit", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        offset = max(int(request.query.get("offset", 0)), 0)
+    except ValueError:
+        return _error(400, "limit and offset must be integers")
+    # every store change bumps the revision, so it fully identifies this page;
+    # the epoch keeps ETags from a previous process from matching after a restart
+    etag = f'W/"{request.app["etag_epoch"]}-{backend.store.revision}-{request["user_id"]}-{limit}-{offset}"'
+    if request.headers.get("If-None-Match") == etag:
+        return web.Response(status=304, headers={"ETag": etag})
+    visible = [rec for rec in backend.store if _visible(request, rec)]
+    page = visible[offset:offset + limit]
+    body = {
+        "items": [record_json(rec) for rec in page],
+        "total": len(visible),
+        "next_offset": offset + limit if offset + limit < len(visible) else None,
+    }
+    return web.json_response(body, headers={"ETag": etag})
+
+
+async def get_vps(request: web.Request) -> web.Response:
+    return web.json_response(record_json(_lookup(request)))
+
+
+async def create_vps(request: web.Request) -> web.Response:
+    backend: ApiBackend = request.app["backend"]
+    try:
+        body = await request.json()
+    except ValueError:
+        return _error(400, "body must be JSON")
+    try:
+        result = await backend.create(request["user_id"], body)
+    except (KeyError, ValueError) as e:
+        return _error(400, f"invalid request: {e}")
+    if isinstance(result, VPSRecord):
+        return web.json_response(record_json(result), status=201)
+    return web.json_response({"order": result.id, "state": result.state}, status=202)
+
+
+async def vps_action(request: web.Request) -> web.Response:
+    backend: ApiBackend = request.app["backend"]
+    rec = _lookup(request)
+    action = request.match_info["action"]
+    if action not in ("start", "stop", "restart"):
+        return _error(400, "action must be start, stop or restart")
+    await backend.action(rec, action, request["user_id"])
+    return web.json_response(record_json(rec))
+
+
+async def delete_vps(request: web.Request) -> web.Response:
+    backend: ApiBackend = request.app["backend"]
+    rec = _lookup(request)
+    await backend.delete(rec, request["user_id"])
+    return web.Response(status=204)
+
+
+async def stats(request: web.Request) -> web.Response:
+    backend: ApiBackend = request.app["backend"]
+    by_status: Dict[str, int] = {}
+    for rec in backend.store:
+        by_status[rec.status or "unknown"] = by_status.get(rec.status or "unknown", 0) + 1
+    return web.json_response({
+        "vps_total": len(backend.store),
+        "by_status": by_status,
+        "docker_queue_depth": backend.scheduler.queue_depth(),
+        "event_subscribers": len(backend.events),
+    })
+
+
+async def events(request: web.Request) -> web.StreamResponse:
+    backend: ApiBackend = request.app["backend"]
+    resp = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await resp.prepare(request)
+    q = backend.events.subscribe()
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(q.get(), SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                await resp.write(b": keepalive\n\n")
+                continue
+            rec = backend.store.get(event.get("vps", ""))
+            if not (request["admin"] or _visible(request, rec) or event.get("owner") == request["user_id"]):
+                continue
+            data = json.dumps(event, separators=(",", ":"))
+            await resp.write(f"event: {event.get('type', 'message')}\ndata: {data}\n\n".encode())
+    except ConnectionResetError:
+        pass
+    finally:
+        backend.events.unsubscribe(q)
+    return resp
+
+
+def create_app(backend: ApiBackend) -> web.Application:
+    app = web.Application(middlewares=[auth_middleware])
+    app["backend"] = backend
+    app["etag_epoch"] = secrets.token_hex(4)
+    app.router.add_get("/api/vps", list_vps)
+    app.router.add_post("/api/vps", create_vps)
+    app.router.add_get("/api/vps/{vps_id}", get_vps)
+    app.router.add_post("/api/vps/{vps_id}/{action}", vps_action)
+    app.router.add_delete("/api/vps/{vps_id}", delete_vps)
+    app.router.add_get("/api/stats", stats)
+    app.router.add_get("/api/events", events)
+    return app
+
+
+async def start_api(backend: ApiBackend, host: str, port: int) -> web.AppRunner:
+    """Serve the API on the running event loop; returns the runner (call .cleanup() to stop)."""
+    runner = web.AppRunner(create_app(backend))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"[+] HTTP API listening on http://{host}:{port}")
+    return runner
@@ -0,0 +1,291 @@
+"""
+Catalog of VPS images: aliases, background pre-pull, refresh and eviction.
+
+Only images in the catalog can be used for a VPS, and the create path never
+pulls. If an image is not on the host yet, the caller kicks off a background
+fetch with request() and tells the user to retry. Pulls (or builds, for
+images with a builder such as the bot's own base image) run in the executor,
+with at most `concurrency` at a time.
+
+Per image the catalog tracks its size on disk and when it was last pulled
+and last used. Both are persisted to a small JSON file next to the bot.
+refresh() re-pulls images that are still in use, so tags like "debian:12"
+pick up security updates. Images that have been neither used nor pulled for
+`unused_ttl` are evicted, least recently active first, while the catalog is
+over `disk_budget` bytes. A freshly added image therefore gets a full TTL
+before it can be evicted, even if nobody has used it yet.
+Pinned images are never evicted. Docker refuses to remove an image that a
+container still uses, and such images are simply kept. Sizes are each
+image's full size, so layers shared between images are counted more than once.
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import docker
+
+SCHEMA_VERSION = 1
+
+IMAGE_MISSING = "missing"
+IMAGE_FETCHING = "fetching"
+IMAGE_READY = "ready"
+IMAGE_FAILED = "failed"
+
+
+class ImageNotReady(RuntimeError):
+    """The image is in the catalog but not on the host yet; a fetch has been started."""
+
+
+@dataclass(slots=True)
+class CatalogImage:
+    alias: str
+    ref: str
+    pinned: bool = False
+    custom: bool = False      # added at runtime (persisted), not from the bot's config
+    state: str = IMAGE_MISSING
+    size: int = 0             # bytes
+    last_pulled: float = 0.0
+    last_used: float = 0.0
+    error: str = ""
+
+    def describe(self) -> str:
+        size = f"{self.size / 1024 ** 2:.0f} MB" if self.size else "-"
+        used = time.strftime("%Y-%m-%d", time.localtime(self.last_used)) if self.last_used else "never"
+        state = f"{self.state} ({self.error})" if self.state == IMAGE_FAILED else self.state
+        pin = " 📌" if self.pinned else ""
+        return f"`{self.alias}` → `{self.ref}`{pin} — {state}, {size}, last used {used}"
+
+
+class ImageCatalog:
+    def __init__(self, client, path, images: Dict[str, str], pinned=(),
+                 builders: Optional[Dict[str, Callable[[], None]]] = None, concurrency: int = 2,
+                 disk_budget: int = 20 * 1024 ** 3, unused_ttl: float = 14 * 86400):
+        """
+        images:   alias -> image reference from the bot's config
+        pinned:   references that are never evicted
+        builders: reference -> function that builds the image (used instead of a pull)
+        """
+        self.client = client
+        self.path = Path(path)
+        self.builders = builders or {}
+        self.disk_budget = disk_budget
+        self.unused_ttl = unused_ttl
+        self.entries: Dict[str, CatalogImage] = {}
+        for alias, ref in images.items():
+            self.entries[alias] = CatalogImage(alias, ref, pinned=ref in pinned)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.load()
+
+    # ---------------- persistence ----------------
+    def load(self):
+        if not self.path.exists():
+            return
+        data = json.loads(self.path.read_text())
+        for alias, info in data.get("images", {}).items():
+            entry = self.entries.get(alias)
+            if entry is None:
+                if not info.get("custom"):
+                    continue  # dropped from the config
+                entry = self.entries[alias] = CatalogImage(alias, info["ref"], custom=True)
+            elif entry.ref != info.get("ref"):
+                continue  # alias now points at another image; its stats do not apply
+            entry.size = info.get("size", 0)
+            entry.last_pulled = info.get("last_pulled", 0.0)
+            entry.last_used = info.get("last_used", 0.0)
+
+    def save(self):
+        images = {}
+        for e in self.entries.values():
+            info = {"ref": e.ref, "size": e.size, "last_pulled": e.last_pulled, "last_used": e.last_used}
+            if e.custom:
+                info["custom"] = True
+            images[e.alias] = info
+        text = json.dumps({"schema": SCHEMA_VERSION, "images": images}, indent=2)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent or ".", prefix=self.path.name, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(text)
+            os.replace(tmp, self.path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    # ---------------- lookup ----------------
+    def __iter__(self) -> Iterator[CatalogImage]:
+        return iter(list(self.entries.values()))
+
+    def resolve(self, name: str) -> Optional[CatalogImage]:
+        """Find an image by alias or by its full reference."""
+        entry = self.entries.get(name)
+        if entry is not None:
+            return entry
+        return next((e for e in self.entries.values() if e.ref == name), None)
+
+    def add(self, alias: str, ref: str) -> CatalogImage:
+        if alias in self.entries:
+            raise ValueError(f"alias {alias} already exists")
+        entry = self.entries[alias] = CatalogImage(alias, ref, custom=True)
+        self.save()
+        return entry
+
+    def remove(self, alias: str) -> CatalogImage:
+        entry = self.entries.get(alias)
+        if entry is None:
+            raise KeyError(alias)
+        if not entry.custom:
+            raise ValueError(f"{alias} comes from the bot config and cannot be removed at runtime")
+        del self.entries[alias]
+        self.save()
+        return entry
+
+    def mark_used(self, entry: CatalogImage):
+        entry.last_used = time.time()
+        self.save()
+
+    def is_ready(self, entry: CatalogImage) -> bool:
+        return entry.state == IMAGE_READY
+
+    def disk_usage(self) -> int:
+        return sum(e.size for e in self.entries.values() if e.state == IMAGE_READY)
+
+    # ---------------- fetching ----------------
+    def _inspect_sync(self, ref: str) -> Optional[int]:
+        try:
+            return self.client.images.get(ref).attrs.get("Size", 0)
+        except docker.errors.ImageNotFound:
+            return None
+
+    def _fetch_sync(self, ref: str, force: bool) -> Tuple[int, bool]:
+        """Returns (size, whether the image was pulled/built)."""
+        if not force:
+            size = self._inspect_sync(ref)
+            if size is not None:
+                return size, False
+        builder = self.builders.get(ref)
+        if builder is not None:
+            builder()
+        else:
+            self.client.images.pull(ref)
+        return self._inspect_sync(ref) or 0, True
+
+    async def _fetch(self, entry: CatalogImage, force: bool):
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            try:
+                size, pulled = await loop.run_in_executor(None, self._fetch_sync, entry.ref, force)
+            except Exception as e:
+                print(f"[!] Image {entry.ref}: fetch failed: {e}")
+                if entry.state != IMAGE_READY:
+                    entry.state, entry.error = IMAGE_FAILED, str(e)
+                return
+        entry.state, entry.error, entry.size = IMAGE_READY, "", size
+        if pulled:
+            entry.last_pulled = time.time()
+        self.save()
+
+    def request(self, entry: CatalogImage, force: bool = False) -> asyncio.Task:
+        """Start fetching `entry` in the background (joins a fetch already in flight)."""
+        task = self._tasks.get(entry.ref)
+        if task is None or task.done():
+            if entry.state != IMAGE_READY:
+                entry.state = IMAGE_FETCHING
+            task = asyncio.create_task(self._fetch(entry, force))
+            self._tasks[entry.ref] = task
+        return task
+
+    def invalidate(self, entry: CatalogImage) -> asyncio.Task:
+        """The image turned out to be gone from the host (e.g. removed by hand): fetch it again."""
+        entry.state = IMAGE_MISSING
+        return self.request(entry)
+
+    async def fetch(self, entry: CatalogImage) -> bool:
+        """Wait until `entry` is on the host; returns whether it is ready."""
+        if entry.state != IMAGE_READY:
+            await self.request(entry)
+        return entry.state == IMAGE_READY
+
+    async def sync(self):
+        """Pick up which catalog images are already on the host, and their sizes."""
+        loop = asyncio.get_running_loop()
+        entries = [e for e in self if e.state != IMAGE_FETCHING]
+        sizes = await loop.run_in_executor(None, lambda: [self._inspect_sync(e.ref) for e in entries])
+        for entry, size in zip(entries, sizes):
+            if size is None:
+                entry.state = IMAGE_MISSING if entry.state == IMAGE_READY else entry.state
+            else:
+                entry.state, entry.size = IMAGE_READY, size
+                # first seen already on the host: start its TTL now
+                entry.last_pulled = entry.last_pulled or time.time()
+
+    @staticmethod
+    def _last_active(entry: CatalogImage) -> float:
+        return max(entry.last_used, entry.last_pulled)
+
+    def _in_use(self, entry: CatalogImage) -> bool:
+        return entry.pinned or entry.last_used >= time.time() - self.unused_ttl
+
+    def _wanted(self, entry: CatalogImage) -> bool:
+        # new and recently active images are kept on the host; evicted ones come back on request()
+        cutoff = time.time() - self.unused_ttl
+        return entry.pinned or not entry.last_pulled or self._last_active(entry) >= cutoff
+
+    async def prefetch(self):
+        """Fetch every wanted catalog image that is not on the host yet."""
+        await self.sync()
+        await asyncio.gather(*(self.request(e) for e in self if e.state != IMAGE_READY and self._wanted(e)))
+
+    async def refresh(self) -> List[CatalogImage]:
+        """
+        Evict, then re-pull the images in use (tags move); returns the evicted images.
+        Unused images are not re-pulled, otherwise every refresh would restart their TTL.
+        """
+        await self.sync()
+        evicted = await self.evict()
+        await asyncio.gather(*(
+            self.request(e, force=True) for e in self
+            if e.state == IMAGE_READY and e.ref not in self.builders and self._in_use(e)
+        ))
+        return evicted
+
+    # ---------------- eviction ----------------
+    def _remove_sync(self, ref: str) -> bool:
+        try:
+            self.client.images.remove(ref)
+            return True
+        except docker.errors.ImageNotFound:
+            return True
+        except docker.errors.APIError as e:
+            # typically 409: a container still uses the image
+            print(f"[!] Image {ref}: not evicted: {e}")
+            return False
+
+    async def evict(self) -> List[CatalogImage]:
+        loop = asyncio.get_running_loop()
+        cutoff = time.time() - self.unused_ttl
+        candidates = sorted(
+            (e for e in self if e.state == IMAGE_READY and not e.pinned
+             and self._last_active(e) < cutoff and e.ref not in self._busy_refs()),
+            key=self._last_active,
+        )
+        usage = self.disk_usage()
+        evicted = []
+        for entry in candidates:
+            if usage <= self.disk_budget:
+                break
+            if await loop.run_in_executor(None, self._remove_sync, entry.ref):
+                usage -= entry.size
+                entry.state = IMAGE_MISSING
+                evicted.append(entry)
+        if evicted:
+            self.save()
+        return evicted
+
+    def _busy_refs(self) -> set:
+        return {ref for ref, task in self._tasks.items() if not task.done()}
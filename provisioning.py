@@ -0,0 +1,163 @@
+"""
+Queued, capacity-checked provisioning for self-service orders (v3 /buy).
+
+Orders are admitted only if the host still has room for the plan's RAM, CPU
+and disk once every existing VPS and every queued order is counted. Admitted
+orders wait in a FIFO queue that a small number of workers drain, with a
+pause between creates, so a burst of orders turns into a steady trickle of
+container creates instead of a pile of concurrent cold starts on the daemon.
+
+The actual create is done by the `provision` coroutine passed in by the bot;
+each state change is reported through the order's `on_update` callback.
+"""
+
+import asyncio
+import itertools
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from vps_records import VPSStore
+
+ORDER_QUEUED = "queued"
+ORDER_CREATING = "creating"
+ORDER_READY = "ready"
+ORDER_FAILED = "failed"
+
+
+class OrderRejected(Exception):
+    """Raised by ProvisionQueue.submit() when an order cannot be admitted."""
+
+
+class OutOfCapacity(OrderRejected):
+    """The order is fine but the host or the queue is full right now; retry later."""
+
+
+@dataclass(slots=True)
+class HostCapacity:
+    ram: int          # GB
+    cpu: int          # cores
+    disk: int         # GB
+    overcommit: float = 1.0   # applied to RAM and CPU; disk is never overcommitted
+
+    def fits(self, used: Dict[str, float], ram: int, cpu: int, disk: int) -> bool:
+        return (used["ram"] + ram <= self.ram * self.overcommit
+                and used["cpu"] + cpu <= self.cpu * self.overcommit
+                and used["disk"] + disk <= self.disk)
+
+
+@dataclass(slots=True)
+class Order:
+    id: int
+    user_id: int
+    plan: str
+    cpu_type: str
+    ram: int
+    cpu: int
+    disk: int
+    price: float
+    name: str = ""
+    state: str = ORDER_QUEUED
+    detail: str = ""
+    vps_id: str = ""
+    ssh_key: str = ""
+    on_update: Optional[Callable[["Order"], Awaitable[None]]] = None
+
+
+class ProvisionQueue:
+    def __init__(self, store: VPSStore, capacity: HostCapacity,
+                 provision: Callable[[Order], Awaitable[None]],
+                 concurrency: int = 1, spacing: float = 2.0,
+                 max_pending: int = 100, max_pending_per_user: int = 2):
+        self.store = store
+        self.capacity = capacity
+        self.provision = provision
+        self.concurrency = concurrency
+        self.spacing = spacing
+        self.max_pending = max_pending
+        self.max_pending_per_user = max_pending_per_user
+        self.pending: Dict[int, Order] = {}
+        self._ids = itertools.count(1)
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._used_cache: Dict[str, float] = {}
+        self._used_revision = -1
+
+    def _start(self):
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    # ---------------- admission ----------------
+    def committed(self) -> Dict[str, float]:
+        """Resources held by existing VPSes (cached per store revision) plus queued orders."""
+        if self._used_revision != self.store.revision:
+            used = {"ram": 0, "cpu": 0, "disk": 0}
+            for rec in self.store:
+                used["ram"] += rec.ram
+                used["cpu"] += rec.cpu
+                used["disk"] += rec.disk
+            self._used_cache = used
+            self._used_revision = self.store.revision
+        used = dict(self._used_cache)
+        for order in self.pending.values():
+            used["ram"] += order.ram
+            used["cpu"] += order.cpu
+            used["disk"] += order.disk
+        return used
+
+    def pending_spend(self, user_id: int) -> float:
+        return sum(o.price for o in self.pending.values() if o.user_id == user_id)
+
+    def position(self, order: Order) -> int:
+        return sum(1 for o in self.pending.values() if o.state == ORDER_QUEUED and o.id <= order.id)
+
+    def submit(self, user_id: int, plan: str, cpu_type: str, spec: dict, price: float,
+               on_update: Optional[Callable[[Order], Awaitable[None]]] = None, ssh_key: str = "") -> Order:
+        if len(self.pending) >= self.max_pending:
+            raise OutOfCapacity("The order queue is full, please try again in a few minutes.")
+        if sum(1 for o in self.pending.values() if o.user_id == user_id) >= self.max_pending_per_user:
+            raise OrderRejected("You already have orders being provisioned.")
+        if not self.capacity.fits(self.committed(), spec["ram"], spec["cpu"], spec["disk"]):
+            raise OutOfCapacity(f"Out of capacity for the {plan} plan right now.")
+        self._start()
+        order = Order(id=next(self._ids), user_id=user_id, plan=plan, cpu_type=cpu_type,
+                      ram=spec["ram"], cpu=spec["cpu"], disk=spec["disk"], price=price,
+                      ssh_key=ssh_key, on_update=on_update)
+        self.pending[order.id] = order
+        self._queue.put_nowait(order)
+        return order
+
+    def release(self, order: Order):
+        """
+        Called by the provision callback as soon as the order's VPS record is in the
+        store: from then on the record holds the resources (and the user's credit
+        commitment), so the order must stop counting in committed() / pending_spend().
+        """
+        self.pending.pop(order.id, None)
+
+    # ---------------- workers ----------------
+    async def _notify(self, order: Order):
+        if order.on_update is None:
+            return
+        try:
+            await order.on_update(order)
+        except Exception as e:
+            print(f"[!] Order #{order.id} status update failed: {e}")
+
+    async def _worker(self):
+        while True:
+            order = await self._queue.get()
+            order.state = ORDER_CREATING
+            await self._notify(order)
+            try:
+                await self.provision(order)
+                order.state = ORDER_READY
+            except Exception as e:
+                order.state = ORDER_FAILED
+                order.detail = str(e)
+            finally:
+                self.pending.pop(order.id, None)
+                self._queue.task_done()
+            await self._notify(order)
+            await asyncio.sleep(self.spacing)
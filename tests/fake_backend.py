@@ -0,0 +1,69 @@
+"""
+ApiBackend over fake_docker.FakeDockerClient, used by test_http_api.py.
+
+Run `python tests/fake_backend.py` for a standalone API instance (no Docker
+daemon, no Discord); it prints a bearer token for an admin user.
+"""
+
+import secrets
+import sys
+from pathlib import Path
+from typing import Dict, Set
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from docker_scheduler import DockerScheduler  # noqa: E402
+from fake_docker import FakeDockerClient  # noqa: E402
+from http_api import ApiBackend, EventHub  # noqa: E402
+from image_catalog import ImageNotReady  # noqa: E402
+from vps_records import VPSRecord, VPSStore  # noqa: E402
+
+
+def fake_backend(store: VPSStore, tokens: Dict[str, int], admins: Set[int], client=None) -> ApiBackend:
+    client = client or FakeDockerClient()
+    scheduler = DockerScheduler()
+    hub = EventHub()
+
+    async def fake_create(user_id: int, body: dict) -> VPSRecord:
+        name, image = body["name"], body.get("image", "fake")
+        if image not in {tag for img in client.images.list() for tag in img.tags}:
+            raise ImageNotReady(f"image {image} is still being fetched")
+        cont = await scheduler.submit(lambda: client.containers.run(image, name=f"vps_{name}", detach=True),
+                                      user_id=user_id)
+        rec = VPSRecord(id=cont.id, name=name, owner=user_id, status="running")
+        store.add(rec)
+        store.save()
+        hub.publish({"type": "created", "vps": rec.id, "owner": rec.owner, "status": rec.status})
+        return rec
+
+    async def fake_action(rec: VPSRecord, action: str, user_id: int):
+        await scheduler.submit(lambda: getattr(client.containers.get(rec.id), action)(),
+                               user_id=user_id, vps_key=rec.id, action=action)
+        rec.status = "stopped" if action == "stop" else "running"
+        store.save()
+        hub.publish({"type": "status", "vps": rec.id, "owner": rec.owner, "status": rec.status})
+
+    async def fake_delete(rec: VPSRecord, user_id: int):
+        if rec.owner != user_id and user_id not in admins:
+            raise PermissionError("You don't have permission to delete this VPS.")
+        await scheduler.submit(lambda: client.containers.get(rec.id).remove(force=True),
+                               user_id=user_id, vps_key=rec.id, action="delete")
+        store.remove(rec.id)
+        store.save()
+        hub.publish({"type": "deleted", "vps": rec.id, "owner": rec.owner})
+
+    return ApiBackend(store=store, scheduler=scheduler, events=hub, is_admin=lambda uid: uid in admins,
+                      create=fake_create, action=fake_action, delete=fake_delete, tokens=tokens)
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    from aiohttp import web
+
+    from http_api import create_app
+
+    token = secrets.token_urlsafe(16)
+    store = VPSStore(Path(tempfile.mkdtemp(prefix="vps_api_")) / "vps.json")
+    print(f"[+] Fake backend, token: {token} (user id 1, admin)")
+    web.run_app(create_app(fake_backend(store, {token: 1}, {1})), host="127.0.0.1", port=8080)
@@ -0,0 +1,130 @@
+"""CreditLedger crash recovery / compaction and BillingEngine.sweep() on a temporary directory."""
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from billing import BILLING_PERIOD_SECONDS, BillingEngine, CreditLedger
+from vps_records import VPSRecord, VPSStore
+
+PLANS = {"basic": {"intel": 30.0}}  # credits per billing period
+
+
+class CreditLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "credits.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def crash(self, ledger: CreditLedger):
+        # drop the ledger without the compaction close() would do
+        ledger._log.close()
+
+    def test_replays_ledger_after_crash(self):
+        ledger = CreditLedger(self.path)
+        ledger.credit(1, 100)
+        ledger.debit(1, 30, "usage")
+        ledger.credit(2, 5)
+        self.crash(ledger)
+        ledger = CreditLedger(self.path)
+        self.assertEqual((ledger.balance(1), ledger.balance(2), ledger.seq), (70, 5, 3))
+
+    def test_torn_line_is_skipped_and_ledger_compacted(self):
+        ledger = CreditLedger(self.path)
+        ledger.credit(1, 100)
+        self.crash(ledger)
+        with open(ledger.ledger_path, "a") as f:
+            f.write('{"s":2,"t":0,"u":1,"d":-5')  # crash mid-write
+        ledger = CreditLedger(self.path)
+        self.assertEqual(ledger.balance(1), 100)
+        self.assertEqual(ledger.ledger_path.read_text(), "")
+        # entries posted after recovery survive the next load
+        ledger.credit(1, 7)
+        self.crash(ledger)
+        self.assertEqual(CreditLedger(self.path).balance(1), 107)
+
+    def test_last_entry_without_newline_is_kept(self):
+        ledger = CreditLedger(self.path)
+        ledger.credit(1, 100)
+        self.crash(ledger)
+        text = ledger.ledger_path.read_text()
+        ledger.ledger_path.write_text(text.rstrip("\n"))
+        ledger = CreditLedger(self.path)
+        ledger.credit(1, 1)
+        self.crash(ledger)
+        self.assertEqual(CreditLedger(self.path).balance(1), 101)
+
+    def test_entries_already_in_snapshot_are_not_replayed(self):
+        ledger = CreditLedger(self.path)
+        ledger.credit(1, 100)
+        ledger.credit(1, 10)
+        entries = ledger.ledger_path.read_text()
+        ledger.compact()
+        ledger.credit(1, 1)
+        self.crash(ledger)
+        # crash between writing the snapshot and truncating the ledger: seq 1-2 are still there
+        ledger.ledger_path.write_text(entries + ledger.ledger_path.read_text())
+        ledger = CreditLedger(self.path)
+        self.assertEqual((ledger.balance(1), ledger.seq), (111, 3))
+
+    def test_compacts_every_n_entries(self):
+        ledger = CreditLedger(self.path, compact_every=3)
+        ledger.post([(1, 10, "topup"), (2, 20, "topup")])
+        self.assertNotEqual(ledger.ledger_path.read_text(), "")
+        ledger.credit(1, 1)
+        self.assertEqual(ledger.ledger_path.read_text(), "")
+        snapshot = json.loads(self.path.read_text())
+        self.assertEqual((snapshot["seq"], snapshot["balances"]), (3, {"1": 11, "2": 20}))
+        self.crash(ledger)
+        self.assertEqual(CreditLedger(self.path).balances, {1: 11, 2: 20})
+
+    def test_loads_legacy_credits_file(self):
+        self.path.write_text(json.dumps({"123": 50}))
+        ledger = CreditLedger(self.path)
+        self.assertEqual(ledger.balance(123), 50)
+        ledger.close()
+
+
+class SweepTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = VPSStore(Path(self.tmp.name) / "vps.json")
+        self.ledger = CreditLedger(Path(self.tmp.name) / "credits.json")
+        self.engine = BillingEngine(self.store, self.ledger, PLANS)
+
+    def tearDown(self):
+        self.ledger.close()
+        self.tmp.cleanup()
+
+    def add(self, vps_id: str, owner: int, plan: str = "basic") -> VPSRecord:
+        rec = VPSRecord(id=vps_id, name=vps_id, owner=owner, plan=plan, cpu_type="intel", status="running")
+        self.store.add(rec)
+        return rec
+
+    def test_bills_usage_and_suspends_running_vpses_of_broke_owners(self):
+        rich, broke, stopped = self.add("1", owner=1), self.add("2", owner=2), self.add("3", owner=2)
+        self.add("4", owner=2, plan="free")  # not a billed plan
+        self.ledger.credit(1, 100)
+        self.ledger.credit(2, 1)
+        self.engine.start_metering(now=0)
+        self.engine.on_container_event(stopped.container_ref, "die", ts=BILLING_PERIOD_SECONDS / 30)
+
+        suspend = self.engine.sweep(now=BILLING_PERIOD_SECONDS / 10)
+        self.assertEqual(suspend, [broke])
+        self.assertAlmostEqual(self.ledger.balance(rich.owner), 97)
+        self.assertAlmostEqual(self.ledger.balance(broke.owner), 1 - 3 - 1)
+
+    def test_sweep_forgets_deleted_vpses(self):
+        rec = self.add("1", owner=1)
+        self.engine.start_metering(now=0)
+        self.store.remove(rec.id)
+        self.assertEqual(self.engine.sweep(now=100), [])
+        self.assertFalse(self.engine.meter.is_running(rec.id))
+        self.assertEqual(self.ledger.balance(1), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
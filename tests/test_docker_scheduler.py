@@ -0,0 +1,82 @@
+"""DockerScheduler ordering (lanes, fair queuing), coalescing, rate limits and state pruning."""
+
+import asyncio
+import time
+import unittest
+
+from docker_scheduler import LANE_ADMIN, LANE_LIFECYCLE, LANE_USER, DockerScheduler, RateLimited
+
+
+class DockerSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # one call at a time, so the log shows the order ops were served in
+        self.sched = DockerScheduler(max_concurrency=1, user_rate=100, user_burst=100,
+                                     vps_rate=100, vps_burst=100)
+        self.log = []
+
+    def op(self, label: str):
+        def fn():
+            self.log.append(label)
+            return label
+        return fn
+
+    async def test_users_are_served_fairly_within_a_lane(self):
+        futures = [self.sched.submit(self.op(f"a{i}"), user_id=1) for i in range(3)]
+        futures += [self.sched.submit(self.op(f"b{i}"), user_id=2) for i in range(2)]
+        await asyncio.gather(*futures)
+        self.assertEqual(self.log, ["a0", "b0", "a1", "b1", "a2"])
+
+    async def test_weight_gives_a_bigger_share(self):
+        futures = [self.sched.submit(self.op(f"a{i}"), user_id=1, weight=2) for i in range(4)]
+        futures += [self.sched.submit(self.op(f"b{i}"), user_id=2) for i in range(2)]
+        await asyncio.gather(*futures)
+        self.assertEqual(self.log, ["a0", "a1", "b0", "a2", "a3", "b1"])
+
+    async def test_lanes_are_served_in_priority_order(self):
+        futures = [
+            self.sched.submit(self.op("user"), user_id=1, lane=LANE_USER),
+            self.sched.submit(self.op("lifecycle"), user_id=1, lane=LANE_LIFECYCLE),
+            self.sched.submit(self.op("admin"), user_id=1, lane=LANE_ADMIN),
+        ]
+        await asyncio.gather(*futures)
+        self.assertEqual(self.log, ["admin", "lifecycle", "user"])
+
+    async def test_identical_pending_ops_coalesce(self):
+        first = self.sched.submit(self.op("restart"), user_id=1, vps_key="v1", action="restart")
+        second = self.sched.submit(self.op("restart again"), user_id=2, vps_key="v1", action="restart")
+        other = self.sched.submit(self.op("stop"), user_id=1, vps_key="v1", action="stop")
+        self.assertEqual(await asyncio.gather(first, second, other), ["restart", "restart", "stop"])
+        self.assertEqual(self.log, ["restart", "stop"])
+        # once served, the same action queues a new call
+        await self.sched.submit(self.op("restart later"), user_id=1, vps_key="v1", action="restart")
+        self.assertEqual(self.log[-1], "restart later")
+
+    async def test_rate_limits_and_admin_bypass(self):
+        sched = DockerScheduler(user_rate=0.01, user_burst=2)
+        await sched.submit(lambda: None, user_id=1)
+        await sched.submit(lambda: None, user_id=1)
+        with self.assertRaises(RateLimited) as cm:
+            sched.submit(lambda: None, user_id=1)
+        self.assertEqual(cm.exception.scope, "user")
+        await sched.submit(lambda: None, user_id=1, lane=LANE_ADMIN)
+        await sched.submit(lambda: None, user_id=1, charge=False)
+
+    async def test_idle_state_is_pruned(self):
+        sched = DockerScheduler(user_rate=1000, user_burst=1, vps_rate=1000, vps_burst=1, prune_interval=0)
+        for user_id in range(50):
+            await sched.submit(lambda: None, user_id=user_id, vps_key=f"v{user_id}", action="start")
+        time.sleep(0.01)  # every bucket refills
+        await sched.submit(lambda: None, user_id=0, lane=LANE_ADMIN)
+        self.assertEqual((sched._user_buckets, sched._vps_buckets), ({}, {}))
+        self.assertEqual(list(sched._last_finish), [(LANE_ADMIN, 0)])
+
+    async def test_pruning_keeps_fairness_of_queued_ops(self):
+        self.sched.prune_interval = 0
+        futures = [self.sched.submit(self.op(f"a{i}"), user_id=1) for i in range(3)]
+        futures.append(self.sched.submit(self.op("b0"), user_id=2))
+        await asyncio.gather(*futures)
+        self.assertEqual(self.log, ["a0", "b0", "a1", "a2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+"""HTTP API routes exercised through aiohttp's test client on a fake_docker backend (no daemon, no Discord)."""
+
+import asyncio
+import json
+import tempfile
+from pathlib import Path
+
+from aiohttp.test_utils import AioHTTPTestCase
+
+from fake_backend import fake_backend
+from fake_docker import FakeDockerClient
+from http_api import ServiceUnavailable, create_app
+from vps_records import VPSRecord, VPSStore
+
+ADMIN, USER, OTHER = 1, 2, 3
+TOKENS = {"admin-token": ADMIN, "user-token": USER, "other-token": OTHER}
+
+
+def auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+class HttpApiTest(AioHTTPTestCase):
+    async def get_application(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.docker = FakeDockerClient()
+        self.store = VPSStore(Path(self.tmp.name) / "vps.json")
+        self.backend = fake_backend(self.store, TOKENS, {ADMIN}, client=self.docker)
+        return create_app(self.backend)
+
+    async def asyncTearDown(self):
+        await super().asyncTearDown()
+        self.tmp.cleanup()
+
+    async def create(self, name: str, token: str = "user-token", **body):
+        resp = await self.client.post("/api/vps", json={"name": name, **body}, headers=auth(token))
+        return resp.status, await resp.json()
+
+    async def test_requires_token(self):
+        resp = await self.client.get("/api/vps")
+        self.assertEqual(resp.status, 401)
+        resp = await self.client.get("/api/vps", headers=auth("wrong"))
+        self.assertEqual(resp.status, 401)
+
+    async def test_create_list_and_visibility(self):
+        status, body = await self.create("web")
+        self.assertEqual(status, 201)
+        self.assertEqual(body["owner"], USER)
+        self.assertNotIn("root_pass", body)
+
+        resp = await self.client.get("/api/vps", headers=auth("user-token"))
+        self.assertEqual([v["name"] for v in (await resp.json())["items"]], ["web"])
+        resp = await self.client.get("/api/vps", headers=auth("other-token"))
+        self.assertEqual((await resp.json())["total"], 0)
+        resp = await self.client.get(f"/api/vps/{body['id']}", headers=auth("other-token"))
+        self.assertEqual(resp.status, 404)
+        resp = await self.client.get(f"/api/vps/{body['id']}", headers=auth("admin-token"))
+        self.assertEqual(resp.status, 200)
+
+    async def test_pagination(self):
+        for i in range(5):
+            await self.create(f"vps{i}")
+        resp = await self.client.get("/api/vps?limit=2&offset=2", headers=auth("user-token"))
+        body = await resp.json()
+        self.assertEqual(len(body["items"]), 2)
+        self.assertEqual((body["total"], body["next_offset"]), (5, 4))
+        resp = await self.client.get("/api/vps?limit=x", headers=auth("user-token"))
+        self.assertEqual(resp.status, 400)
+
+    async def test_etag_changes_on_unsaved_add_and_remove(self):
+        await self.create("web")
+        resp = await self.client.get("/api/vps", headers=auth("user-token"))
+        etag = resp.headers["ETag"]
+        resp = await self.client.get("/api/vps", headers={**auth("user-token"), "If-None-Match": etag})
+        self.assertEqual(resp.status, 304)
+
+        self.store.add(VPSRecord(id="pending", name="pending", owner=USER))
+        resp = await self.client.get("/api/vps", headers={**auth("user-token"), "If-None-Match": etag})
+        self.assertEqual(resp.status, 200)
+        etag = resp.headers["ETag"]
+        self.store.remove("pending")
+        resp = await self.client.get("/api/vps", headers={**auth("user-token"), "If-None-Match": etag})
+        self.assertEqual(resp.status, 200)
+
+    async def test_actions_and_delete(self):
+        _, body = await self.create("web")
+        resp = await self.client.post(f"/api/vps/{body['id']}/stop", headers=auth("user-token"))
+        self.assertEqual((await resp.json())["status"], "stopped")
+        self.assertEqual(self.docker.containers.get(body["id"]).status, "exited")
+        resp = await self.client.post(f"/api/vps/{body['id']}/explode", headers=auth("user-token"))
+        self.assertEqual(resp.status, 400)
+
+        resp = await self.client.delete(f"/api/vps/{body['id']}", headers=auth("user-token"))
+        self.assertEqual(resp.status, 204)
+        self.assertNotIn(body["id"], self.store)
+
+    async def test_delete_forbidden_for_shared_user(self):
+        _, body = await self.create("web")
+        self.store.get(body["id"]).shared_with.add(OTHER)
+        resp = await self.client.delete(f"/api/vps/{body['id']}", headers=auth("other-token"))
+        self.assertEqual(resp.status, 403)
+
+    async def test_missing_container_is_404(self):
+        _, body = await self.create("web")
+        self.docker.containers.get(body["id"]).remove(force=True)
+        resp = await self.client.post(f"/api/vps/{body['id']}/start", headers=auth("user-token"))
+        self.assertEqual(resp.status, 404)
+        self.assertEqual((await resp.json())["error"], "container not found on host")
+
+    async def test_image_not_ready_is_503(self):
+        status, body = await self.create("web", image="debian:12")
+        self.assertEqual(status, 503)
+        self.assertIn("still being fetched", body["error"])
+
+    async def test_no_capacity_is_503(self):
+        async def full(user_id, body):
+            raise ServiceUnavailable("No free IPs available in pool.")
+
+        self.backend.create = full
+        resp = await self.client.post("/api/vps", json={"name": "web"}, headers=auth("user-token"))
+        self.assertEqual(resp.status, 503)
+        self.assertIn("Retry-After", resp.headers)
+
+    async def test_bad_body_is_400(self):
+        resp = await self.client.post("/api/vps", data="not json", headers=auth("user-token"))
+        self.assertEqual(resp.status, 400)
+        resp = await self.client.post("/api/vps", json={}, headers=auth("user-token"))
+        self.assertEqual(resp.status, 400)
+
+    async def test_stats(self):
+        await self.create("a")
+        await self.create("b")
+        resp = await self.client.get("/api/stats", headers=auth("admin-token"))
+        body = await resp.json()
+        self.assertEqual(body["vps_total"], 2)
+        self.assertEqual(body["by_status"], {"running": 2})
+
+    async def test_events_stream_filters_by_owner(self):
+        mine = await self.client.get("/api/events", headers=auth("user-token"))
+        theirs = await self.client.get("/api/events", headers=auth("other-token"))
+        while len(self.backend.events) < 2:
+            await asyncio.sleep(0.01)
+        await self.create("web")
+
+        self.assertEqual(await mine.content.readline(), b"event: created\n")
+        data = json.loads((await mine.content.readline())[len(b"data: "):])
+        self.assertEqual((data["owner"], data["status"]), (USER, "running"))
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(theirs.content.readline(), 0.2)
+        mine.close()
+        theirs.close()
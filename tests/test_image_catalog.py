@@ -0,0 +1,60 @@
+"""ImageCatalog eviction on fake_docker: the unused-image TTL counts from the last pull or use."""
+
+import asyncio
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from fake_docker import FakeDockerClient
+from image_catalog import IMAGE_MISSING, IMAGE_READY, ImageCatalog
+
+DAY = 86400
+
+
+class ImageCatalogEvictionTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.docker = FakeDockerClient(images=[])
+        # budget of 0 bytes: every image past its TTL is evicted
+        self.catalog = ImageCatalog(self.docker, Path(self.tmp.name) / "catalog.json",
+                                    {"deb": "debian:12", "ubu": "ubuntu:22.04"},
+                                    disk_budget=0, unused_ttl=14 * DAY)
+
+    async def asyncTearDown(self):
+        self.tmp.cleanup()
+
+    async def test_freshly_pulled_unused_image_is_kept(self):
+        entry = self.catalog.resolve("deb")
+        self.assertTrue(await self.catalog.fetch(entry))
+        self.assertEqual(entry.last_used, 0.0)
+        self.assertEqual(await self.catalog.evict(), [])
+        self.assertEqual(entry.state, IMAGE_READY)
+
+    async def test_image_already_on_host_starts_its_ttl_at_sync(self):
+        self.docker.images.pull("debian:12")
+        await self.catalog.sync()
+        self.assertEqual(await self.catalog.evict(), [])
+
+    async def test_stale_images_evicted_least_recently_active_first(self):
+        deb, ubu = self.catalog.resolve("deb"), self.catalog.resolve("ubu")
+        await self.catalog.fetch(deb)
+        await self.catalog.fetch(ubu)
+        now = time.time()
+        deb.last_pulled, deb.last_used = now - 40 * DAY, now - 20 * DAY
+        ubu.last_pulled, ubu.last_used = now - 30 * DAY, 0.0
+        self.catalog.disk_budget = deb.size  # one image has to go
+        self.assertEqual(await self.catalog.evict(), [ubu])
+        self.assertEqual((deb.state, ubu.state), (IMAGE_READY, IMAGE_MISSING))
+
+    async def test_refresh_does_not_restart_the_ttl_of_unused_images(self):
+        entry = self.catalog.resolve("deb")
+        await self.catalog.fetch(entry)
+        entry.last_pulled = time.time() - 20 * DAY
+        self.assertEqual(await self.catalog.refresh(), [entry])
+        await asyncio.sleep(0)
+        self.assertEqual(entry.state, IMAGE_MISSING)
+
+
+if __name__ == "__main__":
+    unittest.main()
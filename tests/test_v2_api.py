@@ -0,0 +1,129 @@
+"""
+v2's real API coroutines (api_create / vps_action / api_delete) behind the HTTP API,
+with VPS_FAKE_DOCKER=1 and the bot's files in a temporary working directory.
+Needs discord.py and python-dotenv (v2 imports them); skipped otherwise.
+"""
+
+import importlib
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from aiohttp.test_utils import AioHTTPTestCase
+
+from credentials import CREDENTIALS_DIR
+from docker_scheduler import DockerScheduler
+from http_api import create_app
+from image_catalog import IMAGE_MISSING
+from vps_records import VPSStore
+
+ADMIN, USER = 1, 2
+TOKENS = {"admin-token": ADMIN, "user-token": USER}
+REPO = Path(__file__).resolve().parent.parent
+
+v2 = None
+_tmp = _cwd = None
+
+
+def setUpModule():
+    global v2, _tmp, _cwd
+    missing = [m for m in ("discord", "dotenv") if importlib.util.find_spec(m) is None]
+    if missing:
+        raise unittest.SkipTest(f"v2 dependencies not installed: {', '.join(missing)}")
+    _tmp, _cwd = tempfile.TemporaryDirectory(), os.getcwd()
+    os.chdir(_tmp.name)  # v2 keeps its JSON files and credentials next to the bot
+    os.environ["VPS_FAKE_DOCKER"] = "1"
+    sys.path.insert(0, str(REPO))
+    v2 = importlib.import_module("v2")
+
+
+def tearDownModule():
+    if _tmp is not None:
+        os.chdir(_cwd)
+        os.environ.pop("VPS_FAKE_DOCKER", None)
+        _tmp.cleanup()
+
+
+def auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+class V2ApiTest(AioHTTPTestCase):
+    async def get_application(self):
+        # fresh records and a scheduler bound to this test's event loop
+        v2.store = VPSStore(Path(tempfile.mkdtemp(dir=".")) / "vps_db.json")
+        v2.scheduler = DockerScheduler()
+        v2.save_config({"admin_ids": [ADMIN], "admin_only_create_delete": True})
+        return create_app(v2.api_backend(TOKENS))
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.image = v2.catalog.resolve(v2.DEFAULT_IMAGE)
+        self.assertTrue(await v2.catalog.fetch(self.image))
+
+    async def create(self, name: str, token: str = "admin-token"):
+        resp = await self.client.post("/api/vps", json={"name": name}, headers=auth(token))
+        return resp.status, await resp.json()
+
+    async def test_create_waits_for_the_image_then_provisions(self):
+        v2.docker_client.images.remove(self.image.ref)
+        self.image.state = IMAGE_MISSING
+        status, body = await self.create("web")
+        self.assertEqual(status, 503)
+        self.assertIn("still being fetched", body["error"])
+
+        self.assertTrue(await v2.catalog.fetch(self.image))
+        status, body = await self.create("web")
+        self.assertEqual(status, 201)
+        rec = v2.store.get(body["id"])
+        self.assertTrue(rec.container.startswith("vps_web_"))
+        self.assertEqual(v2.docker_client.containers.get(rec.id).name, rec.container)
+        self.assertTrue((CREDENTIALS_DIR / rec.container / "init.sh").exists())
+        self.assertNotIn("root_pass", body)
+
+    async def test_create_rules(self):
+        status, _ = await self.create("web", token="user-token")
+        self.assertEqual(status, 403)
+        status, _ = await self.create("../etc")
+        self.assertEqual(status, 400)
+
+    async def test_no_free_ip_is_503(self):
+        base = v2.MACVLAN_SUBNET.split("/")[0].rsplit(".", 1)[0]
+        v2.reserved_ips.update(f"{base}.{i}" for i in range(v2.IP_POOL_START, v2.IP_POOL_END + 1))
+        try:
+            resp = await self.client.post("/api/vps", json={"name": "web"}, headers=auth("admin-token"))
+        finally:
+            v2.reserved_ips.clear()
+        self.assertEqual(resp.status, 503)
+        self.assertIn("Retry-After", resp.headers)
+
+    async def test_actions(self):
+        _, body = await self.create("web")
+        resp = await self.client.post(f"/api/vps/{body['id']}/stop", headers=auth("admin-token"))
+        self.assertEqual((await resp.json())["status"], "stopped")
+        self.assertEqual(v2.docker_client.containers.get(body["id"]).status, "exited")
+        resp = await self.client.post(f"/api/vps/{body['id']}/start", headers=auth("admin-token"))
+        self.assertEqual(v2.docker_client.containers.get(body["id"]).status, "running")
+
+    async def test_delete_removes_container_record_and_credentials(self):
+        _, body = await self.create("web")
+        rec = v2.store.get(body["id"])
+        resp = await self.client.delete(f"/api/vps/{rec.id}", headers=auth("admin-token"))
+        self.assertEqual(resp.status, 204)
+        self.assertNotIn(rec.id, v2.store)
+        self.assertFalse((CREDENTIALS_DIR / rec.container).exists())
+
+    async def test_delete_cleans_credentials_of_a_vanished_container(self):
+        _, body = await self.create("web")
+        rec = v2.store.get(body["id"])
+        v2.docker_client.containers.get(rec.id).remove(force=True)
+        resp = await self.client.delete(f"/api/vps/{rec.id}", headers=auth("admin-token"))
+        self.assertEqual(resp.status, 204)
+        self.assertFalse((CREDENTIALS_DIR / rec.container).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
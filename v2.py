@@ -10,11 +10,15 @@ DISCORD_TOKEN=your_discord_token
 Notes:
 - Edit CONFIG below if you need to change networks / options.
 - This script maintains two JSON files:
-    - vps_db.json  (stores VPS metadata)
-    - config.json  (stores admin_ids list and admin-only flag)
+    - vps_db.json  (stores VPS metadata, see vps_records.py; legacy files are migrated on save)
+    - config.json  (stores admin_ids list, admin-only flag and users' SSH public keys)
+    - image_catalog.json (size / last pull / last use per catalog image, runtime-added images)
+- Root passwords / SSH keys are written to vps_credentials/<container>/ and bind-mounted
+  read-only into each VPS at create time (see credentials.py).
 """
 
 import os
+import re
 import json
 import asyncio
 import secrets
@@ -22,15 +26,24 @@ import string
 import tempfile
 import shutil
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, Tuple
 
 import docker
 from docker.types import IPAMConfig, IPAMPool
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import ui
 from dotenv import load_dotenv
 
+from docker_scheduler import DockerScheduler, RateLimited, LANE_ADMIN, LANE_LIFECYCLE, LANE_USER
+from vps_records import VPSRecord, VPSStore
+from http_api import ApiBackend, EventHub, ServiceUnavailable, start_api
+from vps_export import export_records, iter_records
+from health import HealthMonitor, wait_for_ssh
+from credentials import (INIT_COMMAND, READ_ONLY_SHADOW_SETUP, credential_volumes,
+                         remove_credentials, valid_public_key, write_credentials)
+from image_catalog import ImageCatalog, ImageNotReady
+
 # ---------------- CONFIG (EDIT BEFORE RUNNING) ----------------
 PARENT_INTERFACE = "eth0"               # host NIC used for macvlan
 MACVLAN_NETWORK_NAME = "pub_macvlan_net"
@@ -38,8 +51,22 @@ MACVLAN_SUBNET = "45.45.45.0/24"        # replace with your routed subnet
 MACVLAN_GATEWAY = "45.45.45.1"
 IP_POOL_START = 10                      # .10 .. .END
 IP_POOL_END = 50
-BASE_IMAGE_TAG = "ipv4_vps_base:22.04"  # built if missing (Ubuntu+openssh)
-DEFAULT_IMAGE = BASE_IMAGE_TAG
+BASE_IMAGE_TAG = "ipv4_vps_base:22.04-2"  # built if missing (Ubuntu+openssh, shadow linked to /run for read-only roots)
+# Image catalog: the only images !createvps accepts (alias -> reference). Each one must
+# provide /bin/sh and /usr/sbin/sshd (see credentials.py) and, because VPSes run with a
+# read-only root, must be built with credentials.READ_ONLY_SHADOW_SETUP (/etc/shadow linked
+# to /run/vps/shadow); otherwise init.sh cannot install the root password and the container
+# exits. Admins can add more with !images add.
+IMAGE_CATALOG = {
+    "ubuntu": BASE_IMAGE_TAG,
+    # "debian": "registry.example.com/vps/debian-sshd:12",
+}
+DEFAULT_IMAGE = "ubuntu"
+IMAGE_CATALOG_PATH = Path("image_catalog.json")
+IMAGE_PULL_CONCURRENCY = 2
+IMAGE_REFRESH_INTERVAL = 6 * 3600   # seconds between re-pulls / eviction passes
+IMAGE_DISK_BUDGET_GB = 20           # evict unused images while the catalog uses more than this
+IMAGE_UNUSED_TTL_DAYS = 14          # only images unused this long are evicted
 VPS_DB_PATH = Path("vps_db.json")
 CONFIG_PATH = Path("config.json")
 DEFAULT_ROOT_PASSWORD_LENGTH = 12
@@ -48,15 +75,57 @@ BOT_AUTHOR = "PowerDev"
 BOT_VERSION = "2.1"
 # If True, creation & deletion & listall are restricted to admins (dynamic admin list).
 ADMIN_ONLY_CREATE_DELETE = True
+# Docker scheduler: max parallel daemon calls, and per-user / per-VPS token buckets (ops/sec, burst)
+DOCKER_MAX_CONCURRENCY = 4
+USER_OPS_PER_SEC, USER_OPS_BURST = 0.5, 5
+VPS_OPS_PER_SEC, VPS_OPS_BURST = 0.2, 3
+# SSH health checks. Note: the host cannot reach its own macvlan children unless a
+# macvlan shim interface is configured on it, so this is off by default; enable it once
+# the shim is in place (otherwise every create waits SSH_READY_TIMEOUT and is flagged as down).
+SSH_CHECKS_ENABLED = False
+SSH_READY_TIMEOUT = 60            # seconds to wait for sshd after create
+SSH_NOT_VERIFIED_TEXT = ("SSH was not verified (health checks are off), so it may take a minute "
+                         "before you can log in.")
+HEALTH_CHECK_INTERVAL = 300       # seconds between fleet-wide checks
+HEALTH_CHECK_CONCURRENCY = 32
+# Local HTTP API (disabled while API_TOKENS is empty); tokens map to Discord user IDs
+API_HOST = "127.0.0.1"
+API_PORT = 8080
+API_TOKENS: dict = {}   # {"long-random-token": 123456789012345678}
 # ----------------------------------------------------------------
 
 DISCORD_TOKEN = ""
-# Docker client
-docker_client = docker.from_env()
-
-# Ensure DB + config exist
+# Docker client (VPS_FAKE_DOCKER=1 swaps in the in-memory fake for local testing)
+if os.getenv("VPS_FAKE_DOCKER"):
+    from fake_docker import FakeDockerClient
+    docker_client = FakeDockerClient(images=[])
+else:
+    docker_client = docker.from_env()
+# All Docker calls made for users go through the scheduler (rate limits, fair queuing, coalescing)
+scheduler = DockerScheduler(
+    max_concurrency=DOCKER_MAX_CONCURRENCY,
+    user_rate=USER_OPS_PER_SEC, user_burst=USER_OPS_BURST,
+    vps_rate=VPS_OPS_PER_SEC, vps_burst=VPS_OPS_BURST,
+)
+
+# VPS records (loaded once, kept in memory, written back on every change)
+store = VPSStore(VPS_DB_PATH)
 if not VPS_DB_PATH.exists():
-    VPS_DB_PATH.write_text(json.dumps({"vps": []}, indent=2))
+    store.save()
+# Status change events, streamed to HTTP API clients
+events = EventHub()
+api_runner = None
+# IPs handed out to creates that have not finished yet
+reserved_ips: set = set()
+# Latest SSH probe result per VPS (in memory only)
+health = HealthMonitor(concurrency=HEALTH_CHECK_CONCURRENCY)
+# Allowed images, fetched in the background so creates never wait on a pull
+catalog = ImageCatalog(
+    docker_client, IMAGE_CATALOG_PATH, IMAGE_CATALOG,
+    pinned={BASE_IMAGE_TAG}, builders={BASE_IMAGE_TAG: lambda: build_base_image_sync()},
+    concurrency=IMAGE_PULL_CONCURRENCY, disk_budget=IMAGE_DISK_BUDGET_GB * 1024 ** 3,
+    unused_ttl=IMAGE_UNUSED_TTL_DAYS * 86400,
+)
 
 if not CONFIG_PATH.exists():
     default_cfg = {
@@ -66,25 +135,26 @@ if not CONFIG_PATH.exists():
     CONFIG_PATH.write_text(json.dumps(default_cfg, indent=2))
 
 # ---------------- Helpers ----------------
-def load_db() -> dict:
-    return json.loads(VPS_DB_PATH.read_text())
-
-def save_db(data: dict):
-    VPS_DB_PATH.write_text(json.dumps(data, indent=2))
-
 def load_config() -> dict:
     return json.loads(CONFIG_PATH.read_text())
 
 def save_config(cfg: dict):
     CONFIG_PATH.write_text(json.dumps(cfg, indent=2))
 
+# VPS names become part of the container name (and its credentials directory),
+# so they must be valid Docker container names
+VPS_NAME_RE = re.compile(r"[a-zA-Z0-9][a-zA-Z0-9_.-]{0,62}")
+INVALID_NAME_TEXT = "VPS name must start with a letter or digit and contain only letters, digits, `_`, `.` and `-`."
+
+def valid_vps_name(name: str) -> bool:
+    return VPS_NAME_RE.fullmatch(name) is not None
+
 def gen_password(length=DEFAULT_ROOT_PASSWORD_LENGTH) -> str:
     alphabet = string.ascii_letters + string.digits + "!@#$%&*"
     return ''.join(secrets.choice(alphabet) for _ in range(length))
 
 def find_free_ip() -> Optional[str]:
-    db = load_db()
-    used_ips = {v['ip'] for v in db['vps']}
+    used_ips = {v.ip for v in store} | reserved_ips
     try:
         net = docker_client.networks.get(MACVLAN_NETWORK_NAME)
         for c_id, attrs in (net.attrs.get('Containers') or {}).items():
@@ -127,7 +197,8 @@ ENV DEBIAN_FRONTEND=noninteractive
 RUN apt-get update -y && apt-get install -y openssh-server passwd ca-certificates && \\
     mkdir -p /var/run/sshd && \\
     sed -i 's/^#PasswordAuthentication yes/PasswordAuthentication yes/' /etc/ssh/sshd_config || true && \\
-    sed -i 's/^#PermitRootLogin prohibit-password/PermitRootLogin yes/' /etc/ssh/sshd_config || true
+    sed -i 's/^#PermitRootLogin prohibit-password/PermitRootLogin yes/' /etc/ssh/sshd_config || true && \\
+    {READ_ONLY_SHADOW_SETUP}
 EXPOSE 22
 CMD ["/usr/sbin/sshd","-D"]
 """
@@ -142,17 +213,16 @@ CMD ["/usr/sbin/sshd","-D"]
     finally:
         shutil.rmtree(tmpdir, ignore_errors=True)
 
-def create_container_sync(name: str, ip: str, root_password: str, image: str, jail: bool=True) -> str:
-    """Create container and apply 'jail' security options. Returns container id."""
+def create_container_sync(name: str, ip: str, root_password: str, image: str, jail: bool=True,
+                          ssh_key: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Create container and apply 'jail' security options. Returns (container id, container name).
+    Credentials are mounted in and installed by the entrypoint before sshd starts,
+    so the container is ready as soon as it runs (no exec / sshd restart).
+    """
     ensure_macvlan_sync()
-    # Ensure image exists
-    try:
-        docker_client.images.get(image)
-    except docker.errors.ImageNotFound:
-        if image == BASE_IMAGE_TAG:
-            build_base_image_sync()
-        else:
-            docker_client.images.pull(image)
+    # images are fetched by the catalog; raise ImageNotFound here rather than pull on the create path
+    docker_client.images.get(image)
 
     container_name = f"vps_{name}_{secrets.token_hex(4)}"
     kwargs = {}
@@ -161,29 +231,45 @@ def create_container_sync(name: str, ip: str, root_password: str, image: str, ja
             "read_only": True,
             "cap_drop": ['ALL'],
             "security_opt": ['no-new-privileges'],
-            "tmpfs": {'/tmp': ''},
+            "tmpfs": {'/tmp': '', '/run': ''},
         })
 
-    container = docker_client.containers.run(
-        image,
-        command="/usr/sbin/sshd -D",
-        detach=True,
-        name=container_name,
-        tty=True,
-        network=MACVLAN_NETWORK_NAME,
-        ipv4_address=ip,
-        hostname=container_name,
-        **kwargs
-    )
-
-    # set root password
+    cred_dir = write_credentials(container_name, root_password, ssh_key)
     try:
-        container.exec_run(f"bash -lc \"echo 'root:{root_password}' | chpasswd\"", user='root')
-        container.exec_run("service ssh restart || service sshd restart || true", user='root')
-    except Exception as e:
-        print("[!] Warning: failed to set root password:", e)
+        container = docker_client.containers.run(
+            image,
+            command=INIT_COMMAND,
+            detach=True,
+            name=container_name,
+            tty=True,
+            network=MACVLAN_NETWORK_NAME,
+            ipv4_address=ip,
+            hostname=container_name,
+            volumes=credential_volumes(cred_dir),
+            **kwargs
+        )
+    except Exception:
+        remove_credentials(container_name)
+        raise
+
+    return container.id, container_name
+
+def container_action_sync(container_id: str, action: str):
+    """Run start/stop/restart on a container by id."""
+    cont = docker_client.containers.get(container_id)
+    getattr(cont, action)()
 
-    return container.id
+def remove_container_sync(container_id: str, container_name: str = ""):
+    """Remove the container and its credentials directory (also if the container is already gone)."""
+    try:
+        cont = docker_client.containers.get(container_id)
+        container_name = container_name or cont.name
+        cont.stop(timeout=5)
+        cont.remove()
+    except docker.errors.NotFound:
+        pass
+    if container_name:
+        remove_credentials(container_name)
 
 # ---------------- Discord bot ----------------
 intents = discord.Intents.default()
@@ -198,18 +284,116 @@ def is_dynamic_admin(user: discord.User) -> bool:
         return True
     return False
 
+def is_admin_id(user_id: int) -> bool:
+    # Dynamic admin check by ID only (no guild context, e.g. HTTP API callers)
+    return user_id in load_config().get("admin_ids", [])
+
 def admin_allowed(member: discord.Member) -> bool:
     # Allowed if user has Discord admin perms OR present in dynamic admin list
     return member.guild_permissions.administrator or is_dynamic_admin(member)
 
+def docker_lane(member: discord.Member, default: int = LANE_USER) -> int:
+    # Admins get the priority lane (and skip rate limits); everyone else uses `default`
+    return LANE_ADMIN if admin_allowed(member) else default
+
+def rate_limited_text(e: RateLimited) -> str:
+    return f"⏳ Slow down — too many requests. Try again in {max(1, round(e.retry_after))}s."
+
+# ---------------- VPS operations (shared by commands and the HTTP API) ----------------
+async def create_vps(owner_id: int, name: str, image: str, lane: int) -> VPSRecord:
+    img = catalog.resolve(image)
+    if img is None:
+        raise ValueError(f"Unknown image `{image}`. See !images for the available images.")
+    if not catalog.is_ready(img):
+        catalog.request(img)
+        raise ImageNotReady(f"Image `{img.alias}` is still being fetched, try again in a few minutes.")
+    ip = find_free_ip()
+    if ip is None:
+        raise ServiceUnavailable("No free IPs available in pool.")
+    reserved_ips.add(ip)
+    try:
+        root_pass = gen_password()
+        ssh_key = load_config().get("ssh_keys", {}).get(str(owner_id))
+        try:
+            container_id, container_name = await scheduler.submit(
+                lambda: create_container_sync(name, ip, root_pass, img.ref, jail=True, ssh_key=ssh_key),
+                user_id=owner_id, lane=lane)
+        except docker.errors.ImageNotFound:
+            catalog.invalidate(img)
+            raise ImageNotReady(f"Image `{img.alias}` is no longer on the host and is being fetched again, "
+                                f"try again in a few minutes.")
+        catalog.mark_used(img)
+        entry = VPSRecord(id=container_id, name=name, owner=owner_id, ip=ip, root_pass=root_pass,
+                          container=container_name, status="running")
+        store.add(entry)
+        store.save()
+    finally:
+        reserved_ips.discard(ip)
+    if SSH_CHECKS_ENABLED:
+        health.record(entry.id, await wait_for_ssh(ip, 22, deadline=SSH_READY_TIMEOUT))
+    events.publish({"type": "created", "vps": entry.id, "owner": entry.owner, "status": entry.status})
+    return entry
+
+def health_text(entry: VPSRecord) -> str:
+    result = health.get(entry.id)
+    return result.describe() if result else "not checked yet"
+
+async def vps_action(entry: VPSRecord, action: str, user_id: int, lane: Optional[int] = None):
+    """start / stop / restart a VPS through the scheduler and record the new status."""
+    if lane is None:
+        lane = LANE_ADMIN if is_admin_id(user_id) else LANE_USER
+    cid = entry.id
+    await scheduler.submit(lambda: container_action_sync(cid, action), user_id=user_id,
+                           vps_key=cid, action=action, lane=lane)
+    entry.status = "stopped" if action == "stop" else "running"
+    store.save()
+    events.publish({"type": "status", "vps": entry.id, "owner": entry.owner, "status": entry.status})
+
+async def delete_vps(entry: VPSRecord, user_id: int, lane: Optional[int] = None):
+    if lane is None:
+        lane = LANE_ADMIN if is_admin_id(user_id) else LANE_LIFECYCLE
+    cid, cname = entry.id, entry.container
+    await scheduler.submit(lambda: remove_container_sync(cid, cname), user_id=user_id,
+                           vps_key=cid, action="delete", lane=lane)
+    store.remove(entry.id)
+    store.save()
+    health.forget(entry.id)
+    events.publish({"type": "deleted", "vps": entry.id, "owner": entry.owner})
+
+def admin_only_create_delete() -> bool:
+    return load_config().get("admin_only_create_delete", ADMIN_ONLY_CREATE_DELETE)
+
+async def api_create(user_id: int, body: dict) -> VPSRecord:
+    if admin_only_create_delete() and not is_admin_id(user_id):
+        raise PermissionError("Only admins can create VPS (admin-only enabled).")
+    name = body["name"]
+    if not valid_vps_name(name):
+        raise ValueError(INVALID_NAME_TEXT)
+    return await create_vps(user_id, name, body.get("image") or DEFAULT_IMAGE,
+                            LANE_ADMIN if is_admin_id(user_id) else LANE_LIFECYCLE)
+
+async def api_delete(entry: VPSRecord, user_id: int):
+    if admin_only_create_delete() and not is_admin_id(user_id):
+        raise PermissionError("Only admins can delete VPS (admin-only enabled).")
+    if entry.owner != user_id and not is_admin_id(user_id):
+        raise PermissionError("You don't have permission to delete this VPS.")
+    await delete_vps(entry, user_id)
+
+def api_backend(tokens: dict) -> ApiBackend:
+    """HTTP API backend sharing the store, scheduler and create/action/delete paths of the commands."""
+    return ApiBackend(
+        store=store, scheduler=scheduler, events=events, is_admin=is_admin_id,
+        create=api_create, action=vps_action, delete=api_delete, tokens=tokens,
+    )
+
 # UI for management
 class VPSManageView(ui.View):
-    def __init__(self, vps_entry: dict, timeout: int = 600):
+    def __init__(self, vps_entry: VPSRecord, timeout: int = 600):
         super().__init__(timeout=timeout)
         self.vps_entry = vps_entry
 
     async def interaction_check(self, interaction: discord.Interaction) -> bool:
-        allowed = (interaction.user.id == self.vps_entry['owner'] or interaction.user.id in self.vps_entry.get('shared_with', []) or admin_allowed(interaction.user))
+        allowed = self.vps_entry.can_access(interaction.user.id) or admin_allowed(interaction.user)
         if not allowed:
             await interaction.response.send_message("You don't have permission to use these buttons.", ephemeral=True)
             return False
@@ -219,9 +403,10 @@ class VPSManageView(ui.View):
     async def start_button(self, button: ui.Button, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         try:
-            cont = docker_client.containers.get(self.vps_entry['id'])
-            cont.start()
-            await interaction.followup.send(f"Started {self.vps_entry['name']} ({self.vps_entry['ip']}).")
+            await vps_action(self.vps_entry, "start", interaction.user.id, lane=docker_lane(interaction.user))
+            await interaction.followup.send(f"Started {self.vps_entry.name} ({self.vps_entry.ip}).")
+        except RateLimited as e:
+            await interaction.followup.send(rate_limited_text(e))
         except docker.errors.NotFound:
             await interaction.followup.send("Container not found.")
         except Exception as e:
@@ -231,9 +416,10 @@ class VPSManageView(ui.View):
     async def stop_button(self, button: ui.Button, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         try:
-            cont = docker_client.containers.get(self.vps_entry['id'])
-            cont.stop()
-            await interaction.followup.send(f"Stopped {self.vps_entry['name']}.")
+            await vps_action(self.vps_entry, "stop", interaction.user.id, lane=docker_lane(interaction.user))
+            await interaction.followup.send(f"Stopped {self.vps_entry.name}.")
+        except RateLimited as e:
+            await interaction.followup.send(rate_limited_text(e))
         except docker.errors.NotFound:
             await interaction.followup.send("Container not found.")
         except Exception as e:
@@ -243,9 +429,10 @@ class VPSManageView(ui.View):
     async def restart_button(self, button: ui.Button, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         try:
-            cont = docker_client.containers.get(self.vps_entry['id'])
-            cont.restart()
-            await interaction.followup.send(f"Restarted {self.vps_entry['name']}.")
+            await vps_action(self.vps_entry, "restart", interaction.user.id, lane=docker_lane(interaction.user))
+            await interaction.followup.send(f"Restarted {self.vps_entry.name}.")
+        except RateLimited as e:
+            await interaction.followup.send(rate_limited_text(e))
         except docker.errors.NotFound:
             await interaction.followup.send("Container not found.")
         except Exception as e:
@@ -254,24 +441,37 @@ class VPSManageView(ui.View):
     @ui.button(label="SSH Info", style=discord.ButtonStyle.secondary, custom_id="vps_sshinfo")
     async def sshinfo_button(self, button: ui.Button, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
-        info = f"IP: `{self.vps_entry['ip']}`\nUser: `root`\nPassword: `{self.vps_entry.get('root_pass')}`\nSSH: `ssh root@{self.vps_entry['ip']}`"
+        info = f"IP: `{self.vps_entry.ip}`\nUser: `root`\nPassword: `{self.vps_entry.root_pass}`\nSSH: `ssh root@{self.vps_entry.ip}`\nHealth: {health_text(self.vps_entry)}"
         await interaction.followup.send(info, ephemeral=True)
 
+@tasks.loop(seconds=HEALTH_CHECK_INTERVAL)
+async def health_check_loop():
+    targets = [(v.id, v.ip, 22) for v in store if v.status != "stopped" and v.ip]
+    unhealthy = await health.check_all(targets)
+    if unhealthy:
+        print(f"[!] Health check: {unhealthy}/{len(targets)} VPS not answering SSH")
+
+@tasks.loop(seconds=IMAGE_REFRESH_INTERVAL)
+async def image_refresh_loop():
+    if image_refresh_loop.current_loop == 0:
+        await catalog.prefetch()
+        return
+    evicted = await catalog.refresh()
+    if evicted:
+        print(f"[+] Evicted unused images: {', '.join(e.ref for e in evicted)}")
+
 # Bot events
 @bot.event
 async def on_ready():
     print(f"Logged in as {bot.user} (id={bot.user.id})")
-    # ensure base image exists (build lazily)
-    try:
-        docker_client.images.get(BASE_IMAGE_TAG)
-    except docker.errors.ImageNotFound:
-        print("[+] Base image not found. Building...")
-        loop = asyncio.get_event_loop()
-        try:
-            await loop.run_in_executor(None, build_base_image_sync)
-            print("[+] Base image built.")
-        except Exception as e:
-            print("[!] Error building base image:", e)
+    # fetch / build catalog images in the background, then keep them fresh
+    if not image_refresh_loop.is_running():
+        image_refresh_loop.start()
+    if SSH_CHECKS_ENABLED and not health_check_loop.is_running():
+        health_check_loop.start()
+    global api_runner
+    if API_TOKENS and api_runner is None:
+        api_runner = await start_api(api_backend(API_TOKENS), API_HOST, API_PORT)
     print("Bot ready. Prefix commands:", COMMAND_PREFIX)
 
 # ---------------- Commands (prefix) ----------------
@@ -284,7 +484,7 @@ async def cmd_botinfo(ctx: commands.Context):
     embed.add_field(name="Version", value=BOT_VERSION, inline=True)
     embed.add_field(name="Admin-only create/delete", value=str(cfg.get("admin_only_create_delete", ADMIN_ONLY_CREATE_DELETE)), inline=True)
     embed.add_field(name="Admins", value=", ".join([f"<@{a}>" for a in admins]) or "(none)", inline=False)
-    embed.add_field(name="Commands", value="!createvps !deletevps !listvps !listall !manage !sharevps !sendvps !addadmin !removeadmin !adminlist", inline=False)
+    embed.add_field(name="Commands", value="!createvps !deletevps !listvps !listall !manage !sharevps !sendvps !setsshkey !images !addadmin !removeadmin !adminlist", inline=False)
     await ctx.send(embed=embed)
 
 # createvps (admin-only if configured)
@@ -294,79 +494,107 @@ async def cmd_createvps(ctx: commands.Context, name: str, image: Optional[str] =
     if cfg.get("admin_only_create_delete", ADMIN_ONLY_CREATE_DELETE) and not admin_allowed(ctx.author):
         await ctx.send("Only admins can create VPS (admin-only enabled).")
         return
-    if ' ' in name:
-        await ctx.send("VPS name cannot contain spaces.")
+    if not valid_vps_name(name):
+        await ctx.send(INVALID_NAME_TEXT)
         return
     image = image or DEFAULT_IMAGE
     await ctx.send(f"⏳ Provisioning VPS `{name}` — assigning IPv4 and creating container. Please wait...")
 
-    ip = find_free_ip()
-    if ip is None:
-        await ctx.send("No free IPs available in pool.")
-        return
-    root_pass = gen_password()
-    loop = asyncio.get_running_loop()
     try:
-        container_id = await loop.run_in_executor(None, lambda: create_container_sync(name, ip, root_pass, image, jail=True))
+        entry = await create_vps(ctx.author.id, name, image, docker_lane(ctx.author, LANE_LIFECYCLE))
+    except RateLimited as e:
+        await ctx.send(rate_limited_text(e))
+        return
+    except (ValueError, ImageNotReady) as e:
+        await ctx.send(str(e))
+        return
     except Exception as e:
         await ctx.send(f"Failed to create container: {e}")
         return
-
-    db = load_db()
-    entry = {
-        "id": container_id,
-        "name": name,
-        "owner": ctx.author.id,
-        "ip": ip,
-        "root_pass": root_pass,
-        "shared_with": []
-    }
-    db['vps'].append(entry)
-    save_db(db)
-
-    embed = discord.Embed(title=f"VPS Created — {name}", description=f"IP: `{ip}`", color=0x2ECC71)
+    ip, root_pass, container_id = entry.ip, entry.root_pass, entry.id
+    ssh_check = health.get(container_id)
+    if ssh_check is None:
+        # SSH_CHECKS_ENABLED is off: the container runs, but nobody has seen sshd answer
+        embed = discord.Embed(title=f"VPS Created — {name} (SSH not verified)", description=f"IP: `{ip}`", color=0x95A5A6)
+        embed.add_field(name="SSH check", value=SSH_NOT_VERIFIED_TEXT, inline=False)
+    elif ssh_check.ok:
+        embed = discord.Embed(title=f"VPS Created — {name}", description=f"IP: `{ip}`", color=0x2ECC71)
+    else:
+        embed = discord.Embed(title=f"VPS Created — {name} (SSH not responding)", description=f"IP: `{ip}`", color=0xE67E22)
+        embed.add_field(name="SSH check", value=ssh_check.describe(), inline=False)
     embed.add_field(name="Container ID", value=container_id, inline=False)
     embed.set_footer(text=f"Owned by {ctx.author} • Made by {BOT_AUTHOR}")
     view = VPSManageView(entry)
     await ctx.send(embed=embed, view=view)
     try:
-        await ctx.author.send(f"✅ VPS created.\nName: {name}\nIP: {ip}\nSSH: ssh root@{ip}\nPassword: {root_pass}\nContainer ID: {container_id}")
+        if ssh_check is not None and not ssh_check.ok:
+            await ctx.author.send(f"⚠️ VPS `{name}` ({ip}) was created but SSH is not answering: {ssh_check.describe()}\n"
+                                  f"Check it with `!manage {container_id[:12]} info`; an admin may need to look at it.")
+            return
+        key_note = "\nYour saved SSH key is installed." if load_config().get("ssh_keys", {}).get(str(ctx.author.id)) else ""
+        status = "✅ VPS created." if ssh_check is not None else f"VPS created. {SSH_NOT_VERIFIED_TEXT}"
+        await ctx.author.send(f"{status}\nName: {name}\nIP: {ip}\nSSH: ssh root@{ip}\nPassword: {root_pass}\nContainer ID: {container_id}{key_note}")
     except Exception:
         pass
 
 @bot.command(name="listvps")
 async def cmd_listvps(ctx: commands.Context):
-    db = load_db()
-    owned = [v for v in db['vps'] if v['owner'] == ctx.author.id or ctx.author.id in v.get('shared_with', []) or admin_allowed(ctx.author)]
+    is_admin = admin_allowed(ctx.author)
+    owned = [v for v in store if is_admin or v.can_access(ctx.author.id)]
     if not owned:
         await ctx.send("You don't own or have access to any VPS from this bot.")
         return
     for v in owned:
-        embed = discord.Embed(title=f"{v['name']} ({v['ip']})", color=0x3498DB)
-        embed.add_field(name="Container ID", value=v['id'], inline=False)
-        embed.add_field(name="Owner", value=f"<@{v['owner']}>", inline=True)
-        embed.add_field(name="Shared with", value=", ".join([f"<@{u}>" for u in v.get('shared_with', [])]) or "None", inline=True)
+        embed = discord.Embed(title=f"{v.name} ({v.ip})", color=0x3498DB)
+        embed.add_field(name="Container ID", value=v.id, inline=False)
+        embed.add_field(name="Owner", value=f"<@{v.owner}>", inline=True)
+        embed.add_field(name="Shared with", value=", ".join([f"<@{u}>" for u in sorted(v.shared_with)]) or "None", inline=True)
         view = VPSManageView(v)
         await ctx.send(embed=embed, view=view)
 
+# listall [format=ndjson|csv] [owner=ID] [ip=CIDR] [status=running] [fields=id,name,ip] [secrets=yes]
 @bot.command(name="listall")
-async def cmd_listall(ctx: commands.Context):
+async def cmd_listall(ctx: commands.Context, *options: str):
     cfg = load_config()
     if cfg.get("admin_only_create_delete", ADMIN_ONLY_CREATE_DELETE) and not admin_allowed(ctx.author):
         await ctx.send("Only admins can list all VPS.")
         return
-    db = load_db()
-    if not db['vps']:
+    if not len(store):
         await ctx.send("(no VPS created yet)")
         return
-    all_text = json.dumps(db['vps'], indent=2)
-    if len(all_text) > 1900:
-        p = Path("vps_all.json")
-        p.write_text(all_text)
-        await ctx.send(file=discord.File(str(p)))
-        p.unlink(missing_ok=True)
-    else:
-        await ctx.send(f"```\n{all_text}\n```")
+    opts = {}
+    for opt in options:
+        key, sep, value = opt.partition("=")
+        if not sep or key not in ("format", "owner", "ip", "status", "fields", "secrets"):
+            await ctx.send("Usage: !listall [format=ndjson|csv] [owner=ID] [ip=CIDR] [status=S] [fields=a,b] [secrets=yes]")
+            return
+        opts[key] = value
+    reveal = opts.get("secrets") == "yes"
+    if reveal and not admin_allowed(ctx.author):
+        await ctx.send("Only admins can export root passwords.")
+        return
+
+    def run_export():
+        # runs in a worker thread; store iteration works on a snapshot of the records
+        records = iter_records(store, owner=int(opts["owner"]) if "owner" in opts else None,
+                               ip_range=opts.get("ip"), status=opts.get("status"))
+        fields = opts["fields"].split(",") if "fields" in opts else None
+        return export_records(records, fmt=opts.get("format", "ndjson"), fields=fields, reveal_secrets=reveal)
+
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(None, run_export)
+    except ValueError as e:
+        await ctx.send(f"Invalid export options: {e}")
+        return
+    try:
+        if result.count == 0:
+            await ctx.send("(no VPS match those filters)")
+        elif result.preview is not None:
+            await ctx.send(f"```\n{result.preview}\n```")
+        else:
+            await ctx.send(f"{result.count} VPS exported.", file=discord.File(result.file, filename=result.filename))
+    finally:
+        result.file.close()
 
 @bot.command(name="deletevps")
 async def cmd_deletevps(ctx: commands.Context, vps_id: str):
@@ -374,70 +602,54 @@ async def cmd_deletevps(ctx: commands.Context, vps_id: str):
     if cfg.get("admin_only_create_delete", ADMIN_ONLY_CREATE_DELETE) and not admin_allowed(ctx.author):
         await ctx.send("Only admins can delete VPS (admin-only enabled).")
         return
-    db = load_db()
-    target = None
-    for v in db['vps']:
-        if v['id'].startswith(vps_id) or v['id'] == vps_id:
-            target = v
-            break
+    target = store.find(vps_id)
     if not target:
         await ctx.send("VPS not found.")
         return
-    allowed = (ctx.author.guild_permissions.administrator or ctx.author.id == target['owner'] or admin_allowed(ctx.author))
+    allowed = (ctx.author.guild_permissions.administrator or ctx.author.id == target.owner or admin_allowed(ctx.author))
     if not allowed:
         await ctx.send("You don't have permission to delete this VPS.")
         return
     try:
-        cont = docker_client.containers.get(target['id'])
-        cont.stop(timeout=5)
-        cont.remove()
-    except docker.errors.NotFound:
-        pass
+        await delete_vps(target, ctx.author.id, lane=docker_lane(ctx.author, LANE_LIFECYCLE))
+    except RateLimited as e:
+        await ctx.send(rate_limited_text(e))
+        return
     except Exception as e:
         await ctx.send(f"Failed to remove container: {e}")
         return
-    db['vps'] = [v for v in db['vps'] if v['id'] != target['id']]
-    save_db(db)
-    await ctx.send(f"✅ VPS `{target['name']}` deleted.")
+    await ctx.send(f"✅ VPS `{target.name}` deleted.")
 
 @bot.command(name="manage")
 async def cmd_manage(ctx: commands.Context, vps_id: str, action: str, *, exec_command: Optional[str] = None):
-    db = load_db()
-    target = None
-    for v in db['vps']:
-        if v['id'].startswith(vps_id) or v['id'] == vps_id:
-            target = v
-            break
+    target = store.find(vps_id)
     if not target:
         await ctx.send("VPS not found.")
         return
-    allowed = (ctx.author.id == target['owner'] or ctx.author.guild_permissions.administrator or ctx.author.id in target.get('shared_with', []) or admin_allowed(ctx.author))
+    allowed = (target.can_access(ctx.author.id) or ctx.author.guild_permissions.administrator or admin_allowed(ctx.author))
     if not allowed:
         await ctx.send("You don't have permission to manage this VPS.")
         return
-    try:
-        container = docker_client.containers.get(target['id'])
-    except docker.errors.NotFound:
-        await ctx.send("Container not found on host.")
-        return
+    cid = target.id
+    lane = docker_lane(ctx.author)
     action = action.lower()
     try:
-        if action == "start":
-            container.start()
-            await ctx.send("Started.")
-        elif action == "stop":
-            container.stop()
-            await ctx.send("Stopped.")
-        elif action == "restart":
-            container.restart()
-            await ctx.send("Restarted.")
+        if action in ("start", "stop", "restart"):
+            await vps_action(target, action, ctx.author.id, lane=lane)
+            await ctx.send({"start": "Started.", "stop": "Stopped.", "restart": "Restarted."}[action])
         elif action == "info":
-            await ctx.send(f"Name: {target['name']}\nIP: {target['ip']}\nStatus: {container.status}\nOwner: <@{target['owner']}>")
+            container = await scheduler.submit(lambda: docker_client.containers.get(cid), user_id=ctx.author.id,
+                                               vps_key=cid, action="info", lane=lane)
+            if SSH_CHECKS_ENABLED:
+                await health.check(target.id, target.ip, 22)
+            await ctx.send(f"Name: {target.name}\nIP: {target.ip}\nStatus: {container.status}\nSSH: {health_text(target)}\nOwner: <@{target.owner}>")
         elif action == "exec":
             if not exec_command:
                 await ctx.send("Provide a command to exec.")
                 return
-            rc, out = container.exec_run(exec_command, user='root', demux=True)
+            rc, out = await scheduler.submit(
+                lambda: docker_client.containers.get(cid).exec_run(exec_command, user='root', demux=True),
+                user_id=ctx.author.id, vps_key=cid, lane=lane)
             if isinstance(out, tuple):
                 out_text = (out[0] or b'').decode('utf-8', errors='ignore') + (out[1] or b'').decode('utf-8', errors='ignore')
             else:
@@ -447,70 +659,114 @@ async def cmd_manage(ctx: commands.Context, vps_id: str, action: str, *, exec_co
             await ctx.send(f"Exec (rc={rc}):```\n{out_text}\n```")
         else:
             await ctx.send("Unknown action. Use start|stop|restart|info|exec.")
+    except RateLimited as e:
+        await ctx.send(rate_limited_text(e))
+    except docker.errors.NotFound:
+        await ctx.send("Container not found on host.")
     except Exception as e:
         await ctx.send(f"Action failed: {e}")
 
 @bot.command(name="sharevps")
 async def cmd_sharevps(ctx: commands.Context, vps_id: str, op: str, user_id: int):
-    db = load_db()
-    target = None
-    for v in db['vps']:
-        if v['id'].startswith(vps_id) or v['id'] == vps_id:
-            target = v
-            break
+    target = store.find(vps_id)
     if not target:
         await ctx.send("VPS not found.")
         return
-    if ctx.author.id != target['owner'] and not admin_allowed(ctx.author):
+    if ctx.author.id != target.owner and not admin_allowed(ctx.author):
         await ctx.send("Only the owner or an admin can change sharing.")
         return
     op = op.lower()
-    shared: List[int] = target.get('shared_with', [])
+    shared = target.shared_with
     if op == "add":
         if user_id in shared:
             await ctx.send("User already has access.")
             return
-        shared.append(user_id)
-        target['shared_with'] = shared
-        save_db(db)
+        shared.add(user_id)
+        store.save()
         await ctx.send(f"Added <@{user_id}> to shared access.")
     elif op == "remove":
         if user_id not in shared:
             await ctx.send("User does not have shared access.")
             return
-        shared.remove(user_id)
-        target['shared_with'] = shared
-        save_db(db)
+        shared.discard(user_id)
+        store.save()
         await ctx.send(f"Removed <@{user_id}> from shared access.")
     else:
         await ctx.send("Invalid op. Use add or remove.")
 
 @bot.command(name="sendvps")
 async def cmd_sendvps(ctx: commands.Context, vps_id: str, new_owner_id: int):
-    db = load_db()
-    target = None
-    for v in db['vps']:
-        if v['id'].startswith(vps_id) or v['id'] == vps_id:
-            target = v
-            break
+    target = store.find(vps_id)
     if not target:
         await ctx.send("VPS not found.")
         return
-    if ctx.author.id != target['owner'] and not admin_allowed(ctx.author):
+    if ctx.author.id != target.owner and not admin_allowed(ctx.author):
         await ctx.send("Only the owner or an admin can transfer ownership.")
         return
-    old = target['owner']
-    target['owner'] = new_owner_id
-    if new_owner_id in target.get('shared_with', []):
-        target['shared_with'].remove(new_owner_id)
-    save_db(db)
+    old = target.owner
+    target.owner = new_owner_id
+    target.shared_with.discard(new_owner_id)
+    store.save()
     await ctx.send(f"Transferred ownership from <@{old}> to <@{new_owner_id}>.")
     try:
         user = await bot.fetch_user(new_owner_id)
-        await user.send(f"You are now the owner of VPS '{target['name']}' (IP: {target['ip']}).")
+        await user.send(f"You are now the owner of VPS '{target.name}' (IP: {target.ip}).")
     except Exception:
         pass
 
+@bot.command(name="setsshkey")
+async def cmd_setsshkey(ctx: commands.Context, *, public_key: Optional[str] = None):
+    """Save an SSH public key that is installed into every VPS you create from now on."""
+    cfg = load_config()
+    keys = cfg.setdefault("ssh_keys", {})
+    if not public_key or public_key.strip().lower() == "clear":
+        keys.pop(str(ctx.author.id), None)
+        save_config(cfg)
+        await ctx.send("SSH key cleared. New VPS will use password login only.")
+        return
+    public_key = public_key.strip().strip("`")
+    if not valid_public_key(public_key):
+        await ctx.send("That does not look like an SSH public key (expected e.g. `ssh-ed25519 AAAA... comment`).")
+        return
+    keys[str(ctx.author.id)] = public_key
+    save_config(cfg)
+    await ctx.send("✅ SSH key saved. It will be installed in VPS you create from now on.")
+
+@bot.command(name="images")
+async def cmd_images(ctx: commands.Context, op: Optional[str] = None, alias: Optional[str] = None, ref: Optional[str] = None):
+    """!images | !images add <alias> <image:tag> | !images remove <alias> | !images refresh"""
+    if op is None:
+        usage = catalog.disk_usage() / 1024 ** 3
+        lines = [img.describe() for img in catalog]
+        lines.append(f"Disk: {usage:.1f} / {IMAGE_DISK_BUDGET_GB} GB • default: `{DEFAULT_IMAGE}`")
+        await ctx.send("\n".join(lines)[:1990])
+        return
+    if not admin_allowed(ctx.author):
+        await ctx.send("Only admins can change the image catalog.")
+        return
+    op = op.lower()
+    try:
+        if op == "add":
+            if not alias or not ref:
+                await ctx.send("Usage: !images add <alias> <image:tag>")
+                return
+            catalog.request(catalog.add(alias, ref))
+            await ctx.send(f"Added `{alias}` → `{ref}`; pulling it in the background. The image needs "
+                           f"sshd and /etc/shadow linked to /run/vps/shadow (`{READ_ONLY_SHADOW_SETUP}`).")
+        elif op == "remove":
+            catalog.remove(alias or "")
+            await ctx.send(f"Removed `{alias}` from the catalog (the image stays on the host until evicted or removed).")
+        elif op == "refresh":
+            await ctx.send("⏳ Refreshing images...")
+            evicted = await catalog.refresh()
+            await ctx.send("Done." + (f" Evicted: {', '.join(e.ref for e in evicted)}" if evicted else ""))
+        else:
+            await ctx.send("Unknown op. Use add, remove or refresh.")
+    except KeyError:
+        await ctx.send("No such image alias.")
+    except ValueError as e:
+        await ctx.send(str(e))
+
 # ---------------- Admin management (dynamic) ----------------
 @bot.command(name="addadmin")
 async def cmd_addadmin(ctx: commands.Context, user_id: int):
@@ -1,13 +1,59 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands, Interaction
-import json, os, docker, random, asyncio
+import os, docker, random, asyncio, tempfile, shutil, secrets, string, time
+from docker_scheduler import DockerScheduler, RateLimited, LANE_ADMIN, LANE_LIFECYCLE, LANE_USER
+from vps_records import VPSRecord, VPSStore, parse_user_id
+from billing import BillingEngine, CreditLedger, InsufficientCredits
+from provisioning import (HostCapacity, OrderRejected, OutOfCapacity, ProvisionQueue,
+                          ORDER_QUEUED, ORDER_CREATING, ORDER_READY)
+from http_api import ApiBackend, EventHub, ServiceUnavailable, start_api
+from health import HealthMonitor, wait_for_ssh
+from credentials import (INIT_COMMAND, credential_volumes, remove_credentials,
+                         valid_public_key, write_credentials)
+from image_catalog import ImageCatalog, ImageNotReady
 
 # ---------------- CONFIG ----------------
 TOKEN = "YOUR_BOT_TOKEN"
 ADMIN_IDS = [1405866008127864852]  # Admin Discord IDs
 DATA_FILE = "vps_data.json"
 CREDITS_FILE = "credits.json"
+IMAGE_CATALOG_FILE = "v3_image_catalog.json"  # separate from v2's image_catalog.json
+# Docker scheduler: max parallel daemon calls + per-user / per-VPS rate limits (ops/sec, burst)
+DOCKER_MAX_CONCURRENCY = 4
+USER_OPS_PER_SEC, USER_OPS_BURST = 0.5, 5
+VPS_OPS_PER_SEC, VPS_OPS_BURST = 0.2, 3
+# Billing: plan prices are credits per 30 days, charged for running time every tick
+BILLING_INTERVAL_SECONDS = 60
+# Host capacity for /buy orders (RAM/CPU may be overcommitted by HOST_OVERCOMMIT)
+HOST_RAM_GB = 64
+HOST_CPUS = os.cpu_count() or 4
+HOST_DISK_GB = 500
+HOST_OVERCOMMIT = 1.5
+# Provisioning queue: parallel creates and pause between creates
+PROVISION_CONCURRENCY = 1
+PROVISION_SPACING_SECONDS = 2
+# SSH health checks against the published ssh_port on this host
+SSH_PROBE_HOST = "127.0.0.1"
+SSH_READY_TIMEOUT = 60
+HEALTH_CHECK_INTERVAL = 300
+HEALTH_CHECK_CONCURRENCY = 32
+# Local HTTP API (disabled while API_TOKENS is empty); tokens map to Discord user IDs
+API_HOST = "127.0.0.1"
+API_PORT = 8081  # v2.py defaults to 8080, so both bots can run on one host
+API_TOKENS = {}  # {"long-random-token": 1405866008127864852}
+
+# Root passwords are generated per VPS and installed at create time (credentials.py),
+# so the image ships without a usable root password
+IMAGE_TAG = "powerdev-vps:2"
+VPS_DOCKERFILE = '''
+FROM ubuntu:22.04
+RUN apt update && apt install -y openssh-server sudo
+RUN mkdir /var/run/sshd
+RUN sed -i 's/#PermitRootLogin prohibit-password/PermitRootLogin yes/' /etc/ssh/sshd_config
+EXPOSE 22
+CMD ["/usr/sbin/sshd", "-D"]
+'''
 
 VPS_PLANS = {
     "Starter": {"ram": 4, "cpu": 1, "disk": 10, "intel": 42, "amd": 83},
@@ -20,36 +66,139 @@ VPS_PLANS = {
 intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix="/", intents=intents)
-client_docker = docker.from_env()
+if os.getenv("VPS_FAKE_DOCKER"):
+    from fake_docker import FakeDockerClient
+    client_docker = FakeDockerClient(images=[])
+else:
+    client_docker = docker.from_env()
+scheduler = DockerScheduler(
+    max_concurrency=DOCKER_MAX_CONCURRENCY,
+    user_rate=USER_OPS_PER_SEC, user_burst=USER_OPS_BURST,
+    vps_rate=VPS_OPS_PER_SEC, vps_burst=VPS_OPS_BURST,
+)
+store = VPSStore(DATA_FILE)  # VPS records, migrated from the old id->dict layout on first save
+ledger = CreditLedger(CREDITS_FILE)  # credits.json snapshot + credits.ledger append log
+billing = BillingEngine(store, ledger, VPS_PLANS)
+events = EventHub()  # status changes, streamed to HTTP API clients
+health = HealthMonitor(concurrency=HEALTH_CHECK_CONCURRENCY)
+api_runner = None
+# ids and SSH ports handed out to creates that have not finished yet; kept out of the
+# store so an unfinished VPS is never saved to disk
+reserved_ids = set()
+reserved_ports = set()
+# the VPS image, built in the background at startup (see image_catalog.py)
+catalog = ImageCatalog(client_docker, IMAGE_CATALOG_FILE, {"vps": IMAGE_TAG}, pinned={IMAGE_TAG},
+                       builders={IMAGE_TAG: lambda: build_image()})
+vps_image = catalog.resolve("vps")
 
 # ---------------- UTIL ----------------
-def load_data():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r") as f:
-            return json.load(f)
-    return {}
-
-def save_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=4)
-
-def load_credits():
-    if os.path.exists(CREDITS_FILE):
-        with open(CREDITS_FILE, "r") as f:
-            return json.load(f)
-    return {}
-
-def save_credits(credits):
-    with open(CREDITS_FILE, "w") as f:
-        json.dump(credits, f, indent=4)
-
 def is_admin(user_id):
     return user_id in ADMIN_IDS
 
+def docker_lane(user_id):
+    return LANE_ADMIN if is_admin(user_id) else LANE_USER
+
+def container_action(container_name, action):
+    container = client_docker.containers.get(container_name)
+    getattr(container, action)()
+
+def remove_container(container_name):
+    try:
+        container = client_docker.containers.get(container_name)
+        container.stop()
+        container.remove()
+    except docker.errors.NotFound:
+        pass
+    remove_credentials(container_name)
+
+def gen_password(length=16):
+    alphabet = string.ascii_letters + string.digits
+    return "".join(secrets.choice(alphabet) for _ in range(length))
+
+def watch_container_events(loop):
+    # Blocking docker event stream (runs in a thread); feeds start/die into the billing meter.
+    # If the stream breaks (e.g. the daemon restarts) it reconnects with backoff and replays
+    # what it missed via `since`; replayed start/die events are idempotent for the meter.
+    since = None
+    delay = 1
+    while True:
+        try:
+            for event in client_docker.events(decode=True, since=since,
+                                              filters={"type": "container", "event": ["start", "die"]}):
+                delay = 1
+                since = event.get("time") or since
+                name = event.get("Actor", {}).get("Attributes", {}).get("name")
+                if name:
+                    loop.call_soon_threadsafe(on_container_event, name, event.get("Action"), event.get("time"))
+            print(f"⚠️ Docker event stream ended, reconnecting in {delay}s")
+        except Exception as e:
+            print(f"❌ Docker event stream failed: {e}; reconnecting in {delay}s")
+        time.sleep(delay)
+        delay = min(delay * 2, 60)
+
+def on_container_event(name, action, ts):
+    billing.on_container_event(name, action, ts)
+    vps_id = billing.vps_for_container(name)
+    if vps_id:
+        vps = store.get(vps_id)
+        events.publish({"type": "container", "vps": vps_id, "owner": vps.owner if vps else None, "action": action})
+
+# ---------------- BILLING ----------------
+@tasks.loop(seconds=BILLING_INTERVAL_SECONDS)
+async def billing_tick():
+    to_suspend = billing.sweep()
+    if not to_suspend:
+        return
+    results = await asyncio.gather(*(
+        scheduler.submit(lambda name=vps.container_ref: container_action(name, "stop"),
+                         user_id=0, vps_key=vps.id, action="stop", lane=LANE_ADMIN)
+        for vps in to_suspend
+    ), return_exceptions=True)
+    owners = set()
+    for vps, result in zip(to_suspend, results):
+        if isinstance(result, Exception) and not isinstance(result, docker.errors.NotFound):
+            print(f"❌ Failed to suspend VPS {vps.id}: {result}")
+            continue
+        billing.meter.on_state(vps.id, False)
+        vps.status = "suspended"
+        owners.add(vps.owner)
+        events.publish({"type": "status", "vps": vps.id, "owner": vps.owner, "status": vps.status})
+    store.save()
+    for owner in owners:
+        try:
+            user_obj = await bot.fetch_user(owner)
+            await user_obj.send("⚠️ You ran out of credits, so your VPS has been suspended. Top up and use `/managevps` to start it again.")
+        except Exception:
+            pass
+
+@billing_tick.before_loop
+async def before_billing_tick():
+    await bot.wait_until_ready()
+
+@tasks.loop(seconds=HEALTH_CHECK_INTERVAL)
+async def health_check_loop():
+    targets = [(v.id, SSH_PROBE_HOST, v.ssh_port) for v in store if v.status == "running" and v.ssh_port]
+    unhealthy = await health.check_all(targets)
+    if unhealthy:
+        print(f"⚠️ Health check: {unhealthy}/{len(targets)} VPS not answering SSH")
+
 # ---------------- EVENTS ----------------
 @bot.event
 async def on_ready():
+    global api_runner
     print(f"✅ Logged in as {bot.user}")
+    if not billing_tick.is_running():
+        billing.start_metering()
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(None, watch_container_events, loop)
+        billing_tick.start()
+        health_check_loop.start()
+        asyncio.create_task(catalog.prefetch())
+    if API_TOKENS and api_runner is None:
+        api_runner = await start_api(ApiBackend(
+            store=store, scheduler=scheduler, events=events, is_admin=is_admin,
+            create=api_create, action=vps_action, delete=delete_vps, tokens=API_TOKENS,
+        ), API_HOST, API_PORT)
     await bot.change_presence(activity=discord.Activity(type=discord.ActivityType.watching, name="By PowerDev | /help"))
     try:
         synced = await bot.tree.sync()
@@ -58,88 +207,280 @@ async def on_ready():
         print(f"❌ Sync error: {e}")
 
 # ---------------- CREATE VPS ----------------
-@bot.tree.command(name="createvps", description="Create a VPS for a user (Admin only)")
-@app_commands.describe(name="VPS Name", ram="RAM (GB)", cpu="CPU cores", disk="Disk (GB)", user="User Discord ID")
-async def createvps(interaction: Interaction, name: str, ram: int, cpu: int, disk: int, user: str):
-    if not is_admin(interaction.user.id):
-        await interaction.response.send_message("🚫 Only admins can create VPS.", ephemeral=True)
-        return
-
-    await interaction.response.defer(thinking=True)
-
-    data = load_data()
-    vps_id = str(len(data) + 1)
-    container_name = f"vps-{vps_id}"
-    ssh_port = random.randint(20000, 60000)
-
-    # create SSH Dockerfile if not exists
-    dockerfile_content = '''
-    FROM ubuntu:22.04
-    RUN apt update && apt install -y openssh-server sudo
-    RUN mkdir /var/run/sshd
-    RUN echo 'root:root' | chpasswd
-    RUN sed -i 's/#PermitRootLogin prohibit-password/PermitRootLogin yes/' /etc/ssh/sshd_config
-    EXPOSE 22
-    CMD ["/usr/sbin/sshd", "-D"]
-    '''
-    with open("Dockerfile", "w") as f:
-        f.write(dockerfile_content)
-
-    os.system("docker build -t powerdev-vps .")
-
+def build_image():
+    """Build the VPS image; run in the background by the image catalog, never on the create path."""
+    tmpdir = tempfile.mkdtemp(prefix="powerdev_vps_build_")
+    try:
+        with open(os.path.join(tmpdir, "Dockerfile"), "w") as f:
+            f.write(VPS_DOCKERFILE)
+        client_docker.images.build(path=tmpdir, tag=IMAGE_TAG)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+def next_vps_id():
+    vps_id = int(store.next_id())
+    while str(vps_id) in reserved_ids:
+        vps_id += 1
+    return str(vps_id)
+
+def free_ssh_port():
+    used = {v.ssh_port for v in store} | reserved_ports
+    while True:
+        port = random.randint(20000, 60000)
+        if port not in used:
+            return port
+
+def create_vps_container(container_name, ram, cpu, ssh_port, root_pass, ssh_key=None):
+    # credentials are installed by the entrypoint before sshd starts (no exec / restart)
+    cred_dir = write_credentials(container_name, root_pass, ssh_key)
     try:
         container = client_docker.containers.run(
-            "powerdev-vps",
+            IMAGE_TAG,
             name=container_name,
             detach=True,
             tty=True,
             stdin_open=True,
             mem_limit=f"{ram}g",
-            cpus=cpu,
+            nano_cpus=int(cpu * 1e9),
             ports={"22/tcp": ssh_port},
-            command="/usr/sbin/sshd -D"
+            volumes=credential_volumes(cred_dir),
+            command=INIT_COMMAND
         )
+    except Exception:
+        remove_credentials(container_name)
+        raise
+    # make sure Docker actually published 22/tcp on the port we recorded
+    container.reload()
+    bindings = container.ports.get("22/tcp") or []
+    if not any(b.get("HostPort") == str(ssh_port) for b in bindings):
+        container.remove(force=True)
+        remove_credentials(container_name)
+        raise RuntimeError(f"port 22/tcp was not published on {ssh_port}")
+    return container
+
+async def create_vps(owner, name, ram, cpu, disk, plan="", cpu_type="", lane=LANE_ADMIN, user_id=0, ssh_key=None,
+                     require_ssh=False):
+    """
+    Create the container, wait for SSH and store the record; returns the VPSRecord.
+    The record only enters the store (and so the billing meter's container index) after
+    the SSH wait, so the wait is never billed. With require_ssh=True a VPS whose SSH never
+    answers is removed again, without ever having been stored or charged.
+    """
+    if not catalog.is_ready(vps_image):
+        catalog.request(vps_image)
+        raise ImageNotReady("The VPS image is still being built, try again in a few minutes.")
+    vps_id = next_vps_id()
+    vps = VPSRecord(
+        id=vps_id,
+        name=name,
+        owner=owner,
+        container=f"vps-{vps_id}",
+        root_pass=gen_password(),
+        ram=ram,
+        cpu=cpu,
+        disk=disk,
+        status="running",
+        ssh_port=free_ssh_port(),
+        plan=plan,
+        cpu_type=cpu_type,
+    )
+    # reserve the id (and port) in memory while the create is queued
+    reserved_ids.add(vps_id)
+    reserved_ports.add(vps.ssh_port)
+    try:
+        await scheduler.submit(
+            lambda: create_vps_container(vps.container, ram, cpu, vps.ssh_port, vps.root_pass, ssh_key),
+            user_id=user_id, lane=lane, charge=False)
+        catalog.mark_used(vps_image)
+        ssh_check = await wait_for_ssh(SSH_PROBE_HOST, vps.ssh_port, deadline=SSH_READY_TIMEOUT)
+        if require_ssh and not ssh_check.ok:
+            container_name = vps.container
+            await scheduler.submit(lambda: remove_container(container_name), user_id=0,
+                                   vps_key=vps_id, action="delete", lane=LANE_ADMIN)
+            raise RuntimeError(f"SSH never came up ({ssh_check.error}); the VPS was removed and you were not charged")
+        health.record(vps_id, ssh_check)
+        # no await between add() and starting the meter: a late Docker "start" event
+        # finds the meter already running and cannot backdate it
+        store.add(vps)
+        billing.meter.on_state(vps_id, True)
+        store.save()
+    finally:
+        reserved_ids.discard(vps_id)
+        reserved_ports.discard(vps.ssh_port)
+    events.publish({"type": "created", "vps": vps.id, "owner": vps.owner, "status": vps.status})
+    return vps
+
+async def vps_action(vps, act, user_id):
+    """start / stop / restart shared by /managevps and the HTTP API."""
+    if (act in ("start", "restart") and billing.is_billed(vps) and ledger.balance(vps.owner) <= 0
+            and not is_admin(user_id)):
+        raise InsufficientCredits("Out of credits — top up before starting this VPS.")
+    container_name = vps.container_ref
+    await scheduler.submit(lambda: container_action(container_name, act), user_id=user_id,
+                           vps_key=vps.id, action=act, lane=docker_lane(user_id))
+    vps.status = "stopped" if act == "stop" else "running"
+    billing.meter.on_state(vps.id, act != "stop")
+    store.save()
+    events.publish({"type": "status", "vps": vps.id, "owner": vps.owner, "status": vps.status})
+
+async def delete_vps(vps, user_id):
+    if not is_admin(user_id):
+        raise PermissionError("Only admins can delete VPS.")
+    container_name = vps.container_ref
+    await scheduler.submit(lambda: remove_container(container_name), user_id=user_id,
+                           vps_key=vps.id, action="delete", lane=LANE_ADMIN)
+    billing.finalize(vps)
+    health.forget(vps.id)
+    store.remove(vps.id)
+    store.save()
+    events.publish({"type": "deleted", "vps": vps.id, "owner": vps.owner})
+
+async def send_vps_dm(vps):
+    try:
+        user_obj = await bot.fetch_user(vps.owner)
+        embed = discord.Embed(
+            title="🖥️ VPS Created!",
+            description=(
+                f"**VPS ID:** {vps.id}\n"
+                f"**Name:** {vps.name}\n"
+                f"**RAM:** {vps.ram}GB\n"
+                f"**CPU:** {vps.cpu}\n"
+                f"**Disk:** {vps.disk}GB\n"
+                f"**SSH Port:** {vps.ssh_port}\n"
+                f"**Username:** root\n"
+                f"**Password:** {vps.root_pass or 'root'}\n\n"
+                f"Use `/managevps vpsid:{vps.id}` to view or control your VPS."
+            ),
+            color=discord.Color.green()
+        )
+        embed.set_footer(text="Made by PowerDev ⚡")
+        await user_obj.send(embed=embed)
+    except Exception:
+        pass
 
-        data[vps_id] = {
-            "name": name,
-            "user": user,
-            "container": container_name,
-            "ram": ram,
-            "cpu": cpu,
-            "disk": disk,
-            "status": "running",
-            "shared_with": [],
-            "ssh_port": ssh_port
-        }
-        save_data(data)
-
-        # DM user
-        try:
-            user_obj = await bot.fetch_user(int(user))
-            embed = discord.Embed(
-                title="🖥️ VPS Created!",
-                description=(
-                    f"**VPS ID:** {vps_id}\n"
-                    f"**Name:** {name}\n"
-                    f"**RAM:** {ram}GB\n"
-                    f"**CPU:** {cpu}\n"
-                    f"**Disk:** {disk}GB\n"
-                    f"**SSH Port:** {ssh_port}\n"
-                    f"**Username:** root\n"
-                    f"**Password:** root\n\n"
-                    f"Use `/managevps vpsid:{vps_id}` to view or control your VPS."
-                ),
-                color=discord.Color.green()
-            )
-            embed.set_footer(text="Made by PowerDev ⚡")
-            await user_obj.send(embed=embed)
-        except:
-            pass
+@bot.tree.command(name="createvps", description="Create a VPS for a user (Admin only)")
+@app_commands.describe(name="VPS Name", ram="RAM (GB)", cpu="CPU cores", disk="Disk (GB)", user="User Discord ID",
+                       ssh_key="Optional SSH public key to install for root")
+async def createvps(interaction: Interaction, name: str, ram: int, cpu: int, disk: int, user: str, ssh_key: str = None):
+    if not is_admin(interaction.user.id):
+        await interaction.response.send_message("🚫 Only admins can create VPS.", ephemeral=True)
+        return
 
-        await interaction.followup.send(f"✅ VPS `{name}` created successfully. SSH Port: `{ssh_port}`", ephemeral=True)
+    try:
+        owner = parse_user_id(user)
+    except ValueError:
+        await interaction.response.send_message("⚠️ User must be a Discord user ID or mention.", ephemeral=True)
+        return
+
+    if ssh_key and not valid_public_key(ssh_key):
+        await interaction.response.send_message("⚠️ That does not look like an SSH public key.", ephemeral=True)
+        return
 
+    await interaction.response.defer(thinking=True)
+
+    try:
+        vps = await create_vps(owner, name, ram, cpu, disk, user_id=interaction.user.id, ssh_key=ssh_key)
     except Exception as e:
         await interaction.followup.send(f"❌ Error creating VPS: `{e}`", ephemeral=True)
+        return
+
+    await send_vps_dm(vps)
+    ssh_check = health.get(vps.id)
+    if ssh_check and not ssh_check.ok:
+        await interaction.followup.send(
+            f"⚠️ VPS `{name}` created on port `{vps.ssh_port}`, but SSH is not answering: {ssh_check.describe()}", ephemeral=True)
+        return
+    await interaction.followup.send(f"✅ VPS `{name}` created successfully. SSH Port: `{vps.ssh_port}`", ephemeral=True)
+
+# ---------------- BUY VPS ----------------
+async def provision_order(order):
+    # queued orders wait for the image instead of failing right after a restart
+    if not await catalog.fetch(vps_image):
+        raise RuntimeError(f"VPS image unavailable ({vps_image.error})")
+    vps = await create_vps(order.user_id, f"{order.plan}-{order.id}", order.ram, order.cpu, order.disk,
+                           plan=order.plan, cpu_type=order.cpu_type, lane=LANE_LIFECYCLE, user_id=order.user_id,
+                           ssh_key=order.ssh_key or None, require_ssh=True)
+    # the stored record now counts towards capacity and credits; stop counting the order too
+    provisioner.release(order)
+    order.vps_id = vps.id
+    await send_vps_dm(vps)
+
+provisioner = ProvisionQueue(
+    store,
+    HostCapacity(ram=HOST_RAM_GB, cpu=HOST_CPUS, disk=HOST_DISK_GB, overcommit=HOST_OVERCOMMIT),
+    provision_order,
+    concurrency=PROVISION_CONCURRENCY,
+    spacing=PROVISION_SPACING_SECONDS,
+)
+
+def order_status_text(order):
+    if order.state == ORDER_QUEUED:
+        return f"⏳ Order #{order.id} ({order.plan}, {order.cpu_type}) queued — position {provisioner.position(order)}."
+    if order.state == ORDER_CREATING:
+        return f"⚙️ Order #{order.id} ({order.plan}, {order.cpu_type}) — creating your VPS..."
+    if order.state == ORDER_READY:
+        return f"✅ Order #{order.id} ready! VPS ID `{order.vps_id}` — details sent by DM."
+    return f"❌ Order #{order.id} failed: `{order.detail}`"
+
+def place_order(user_id, plan, cpu_type, on_update=None, ssh_key=None):
+    """Validate plan + credits and queue the order (shared by /buy and the HTTP API)."""
+    plan_name = next((p for p in VPS_PLANS if p.lower() == plan.lower()), None)
+    if plan_name is None:
+        raise OrderRejected("Unknown plan. Use `/plans` to see the available plans.")
+    cpu_type = cpu_type.lower()
+    if cpu_type not in ("intel", "amd"):
+        raise OrderRejected("CPU type must be intel or amd.")
+    if ssh_key and not valid_public_key(ssh_key):
+        raise OrderRejected("That does not look like an SSH public key (expected e.g. `ssh-ed25519 AAAA...`).")
+
+    spec = VPS_PLANS[plan_name]
+    price = spec[cpu_type]
+    # billing is usage-based, so require a full period of credits for every VPS the user
+    # already has (and has queued) plus the new one; otherwise one month of credits
+    # would buy any number of VPSes
+    committed = billing.monthly_commitment(user_id) + provisioner.pending_spend(user_id)
+    available = ledger.balance(user_id) - committed
+    if available < price:
+        raise InsufficientCredits(
+            f"{plan_name} ({cpu_type}) costs {price} credits per month; your balance "
+            f"{ledger.balance(user_id):.2f} minus {committed:.2f} committed to your other VPS leaves {available:.2f}.")
+    return provisioner.submit(user_id, plan_name, cpu_type, spec, price, on_update=on_update, ssh_key=ssh_key or "")
+
+async def api_create(user_id, body):
+    if "plan" in body:
+        try:
+            return place_order(user_id, body["plan"], body.get("cpu_type", "intel"), ssh_key=body.get("ssh_key"))
+        except OutOfCapacity as e:
+            raise ServiceUnavailable(str(e))
+        except OrderRejected as e:
+            raise ValueError(str(e))
+    if not is_admin(user_id):
+        raise PermissionError("Only admins can create VPS with custom resources; order a plan instead.")
+    if body.get("ssh_key") and not valid_public_key(body["ssh_key"]):
+        raise ValueError("ssh_key is not an SSH public key")
+    return await create_vps(int(body["owner"]), body["name"], int(body["ram"]), int(body["cpu"]), int(body["disk"]),
+                            user_id=user_id, ssh_key=body.get("ssh_key"))
+
+@bot.tree.command(name="buy", description="Order a VPS plan with your credits")
+@app_commands.describe(plan="Plan name (see /plans)", cpu_type="intel or amd",
+                       ssh_key="Optional SSH public key to install for root")
+async def buy(interaction: Interaction, plan: str, cpu_type: str, ssh_key: str = None):
+    sent = asyncio.Event()
+
+    async def on_update(order):
+        # the queue may pick the order up before the first reply is out
+        await sent.wait()
+        await interaction.edit_original_response(content=order_status_text(order))
+
+    try:
+        order = place_order(interaction.user.id, plan, cpu_type, on_update=on_update, ssh_key=ssh_key)
+    except (OrderRejected, InsufficientCredits) as e:
+        await interaction.response.send_message(f"🚫 {e}", ephemeral=True)
+        return
+    try:
+        await interaction.response.send_message(order_status_text(order), ephemeral=True)
+    finally:
+        sent.set()
 
 # ---------------- DELETE VPS ----------------
 @bot.tree.command(name="deletevps", description="Delete a VPS (Admin only)")
@@ -150,20 +491,17 @@ async def deletevps(interaction: Interaction, vpsid: str):
         return
 
     await interaction.response.defer(thinking=True)
-    data = load_data()
-    if vpsid not in data:
+    vps = store.get(vpsid)
+    if vps is None:
         await interaction.followup.send("❌ VPS ID not found.", ephemeral=True)
         return
 
     try:
-        container = client_docker.containers.get(data[vpsid]["container"])
-        container.stop()
-        container.remove()
-    except docker.errors.NotFound:
-        pass
+        await delete_vps(vps, interaction.user.id)
+    except Exception as e:
+        await interaction.followup.send(f"❌ Error deleting VPS: `{e}`", ephemeral=True)
+        return
 
-    del data[vpsid]
-    save_data(data)
     await interaction.followup.send(f"🗑️ VPS `{vpsid}` deleted successfully.", ephemeral=True)
 
 # ---------------- MANAGE VPS ----------------
@@ -171,46 +509,42 @@ async def deletevps(interaction: Interaction, vpsid: str):
 @app_commands.describe(vpsid="VPS ID", action="start/stop/restart/info")
 async def managevps(interaction: Interaction, vpsid: str, action: str):
     await interaction.response.defer(thinking=True)
-    data = load_data()
+    vps = store.get(vpsid)
 
-    if vpsid not in data:
+    if vps is None:
         await interaction.followup.send("❌ VPS not found.", ephemeral=True)
         return
 
-    vps = data[vpsid]
-    if (
-        str(interaction.user.id) != str(vps["user"])
-        and not is_admin(interaction.user.id)
-        and str(interaction.user.id) not in vps["shared_with"]
-    ):
+    if not vps.can_access(interaction.user.id) and not is_admin(interaction.user.id):
         await interaction.followup.send("🚫 You don’t have access to this VPS.", ephemeral=True)
         return
 
-    try:
-        container = client_docker.containers.get(vps["container"])
-    except docker.errors.NotFound:
-        await interaction.followup.send("❌ Container not found.", ephemeral=True)
-        return
-
     act = action.lower()
-    if act == "start":
-        container.start()
-        vps["status"] = "running"
-    elif act == "stop":
-        container.stop()
-        vps["status"] = "stopped"
-    elif act == "restart":
-        container.restart()
-        vps["status"] = "running"
+    if act in ("start", "stop", "restart"):
+        try:
+            await vps_action(vps, act, interaction.user.id)
+        except InsufficientCredits as e:
+            await interaction.followup.send(f"💸 {e}", ephemeral=True)
+            return
+        except RateLimited as e:
+            await interaction.followup.send(f"⏳ Too many requests. Try again in {max(1, round(e.retry_after))}s.", ephemeral=True)
+            return
+        except docker.errors.NotFound:
+            await interaction.followup.send("❌ Container not found.", ephemeral=True)
+            return
     elif act == "info":
-        embed = discord.Embed(title=f"🖥️ VPS Info: {vps['name']}", color=discord.Color.blurple())
+        embed = discord.Embed(title=f"🖥️ VPS Info: {vps.name}", color=discord.Color.blurple())
         embed.add_field(name="VPS ID", value=vpsid)
-        embed.add_field(name="Status", value=vps["status"])
-        embed.add_field(name="RAM", value=f"{vps['ram']}GB")
-        embed.add_field(name="CPU", value=f"{vps['cpu']}")
-        embed.add_field(name="Disk", value=f"{vps['disk']}GB")
-        embed.add_field(name="SSH Port", value=str(vps["ssh_port"]))
-        embed.add_field(name="Shared With", value=", ".join(vps["shared_with"]) or "None")
+        embed.add_field(name="Status", value=vps.status)
+        embed.add_field(name="RAM", value=f"{vps.ram}GB")
+        embed.add_field(name="CPU", value=f"{vps.cpu}")
+        embed.add_field(name="Disk", value=f"{vps.disk}GB")
+        embed.add_field(name="SSH Port", value=str(vps.ssh_port))
+        if vps.status == "running":
+            await health.check(vps.id, SSH_PROBE_HOST, vps.ssh_port)
+        ssh_check = health.get(vps.id)
+        embed.add_field(name="SSH", value=ssh_check.describe() if ssh_check else "not checked yet")
+        embed.add_field(name="Shared With", value=", ".join(str(u) for u in sorted(vps.shared_with)) or "None")
         embed.set_footer(text="Made by PowerDev ⚡")
         await interaction.followup.send(embed=embed, ephemeral=True)
         return
@@ -218,7 +552,6 @@ async def managevps(interaction: Interaction, vpsid: str, action: str):
         await interaction.followup.send("⚠️ Invalid action. Use: start / stop / restart / info", ephemeral=True)
         return
 
-    save_data(data)
     await interaction.followup.send(f"✅ VPS `{vpsid}` {act}ed successfully.", ephemeral=True)
 
 # ---------------- SHARE VPS ----------------
@@ -230,24 +563,46 @@ async def sharevps(interaction: Interaction, vpsid: str, action: str, userid: st
         return
 
     await interaction.response.defer(thinking=True)
-    data = load_data()
-    if vpsid not in data:
+    vps = store.get(vpsid)
+    if vps is None:
         await interaction.followup.send("❌ VPS not found.", ephemeral=True)
         return
+    try:
+        target = parse_user_id(userid)
+    except ValueError:
+        await interaction.followup.send("⚠️ User must be a Discord user ID or mention.", ephemeral=True)
+        return
 
     if action.lower() == "add":
-        if userid not in data[vpsid]["shared_with"]:
-            data[vpsid]["shared_with"].append(userid)
+        vps.shared_with.add(target)
     elif action.lower() == "remove":
-        if userid in data[vpsid]["shared_with"]:
-            data[vpsid]["shared_with"].remove(userid)
+        vps.shared_with.discard(target)
     else:
         await interaction.followup.send("⚠️ Action must be add or remove.", ephemeral=True)
         return
 
-    save_data(data)
+    store.save()
     await interaction.followup.send(f"✅ VPS `{vpsid}` updated successfully.", ephemeral=True)
 
+# ---------------- CREDITS ----------------
+@bot.tree.command(name="credits", description="Show your credit balance")
+async def credits_cmd(interaction: Interaction):
+    balance = ledger.balance(interaction.user.id)
+    await interaction.response.send_message(f"💰 Balance: **{balance:.2f}** credits", ephemeral=True)
+
+@bot.tree.command(name="addcredits", description="Add (or remove, with a negative amount) credits (Admin only)")
+@app_commands.describe(userid="User ID", amount="Credits to add")
+async def addcredits(interaction: Interaction, userid: str, amount: float):
+    if not is_admin(interaction.user.id):
+        await interaction.response.send_message("🚫 Only admins can change credits.", ephemeral=True)
+        return
+    if not userid.isdigit():
+        await interaction.response.send_message("⚠️ User ID must be numeric.", ephemeral=True)
+        return
+    ledger.credit(int(userid), amount, reason=f"admin:{interaction.user.id}")
+    await interaction.response.send_message(
+        f"✅ <@{userid}> now has **{ledger.balance(int(userid)):.2f}** credits.", ephemeral=True)
+
 # ---------------- VPS PLANS ----------------
 @bot.tree.command(name="plans", description="Show all VPS plans")
 async def plans(interaction: Interaction):
@@ -267,9 +622,12 @@ async def help_cmd(interaction: Interaction):
     embed = discord.Embed(title="🧭 VPS Bot — Help Menu", color=discord.Color.blue())
     embed.add_field(name="/createvps", value="Create a VPS (Admin only)", inline=False)
     embed.add_field(name="/deletevps", value="Delete a VPS (Admin only)", inline=False)
+    embed.add_field(name="/buy", value="Order a VPS plan with your credits", inline=False)
     embed.add_field(name="/managevps", value="Start / Stop / Restart / Info", inline=False)
     embed.add_field(name="/sharevps", value="Share VPS with a user (Admin only)", inline=False)
     embed.add_field(name="/plans", value="View VPS plans", inline=False)
+    embed.add_field(name="/credits", value="Show your credit balance", inline=False)
+    embed.add_field(name="/addcredits", value="Add credits to a user (Admin only)", inline=False)
     embed.add_field(name="/botinfo", value="Show bot information", inline=False)
     embed.set_footer(text="Made by PowerDev ⚡")
     await interaction.response.send_message(embed=embed, ephemeral=True)
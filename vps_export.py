@@ -0,0 +1,139 @@
+"""
+Streaming export of VPS records (v2 !listall).
+
+Records are pulled one at a time from the store, filtered (owner, IP range,
+status), projected to the requested fields and written as NDJSON or CSV
+straight into a gzip stream over a SpooledTemporaryFile. Memory stays flat:
+small exports live in RAM, large ones spill to an anonymous temp file, and no
+fixed path in the working directory is ever used.
+
+Secret fields (root passwords) are redacted unless the caller explicitly asks
+for them with reveal_secrets=True.
+"""
+
+import csv
+import gzip
+import io
+import ipaddress
+import json
+import tempfile
+from dataclasses import dataclass, fields as dc_fields
+from typing import IO, Iterable, Iterator, Optional, Sequence
+
+from vps_records import VPSRecord
+
+ALL_FIELDS = tuple(f.name for f in dc_fields(VPSRecord))
+SECRET_FIELDS = frozenset({"root_pass"})
+DEFAULT_FIELDS = tuple(f for f in ALL_FIELDS if f not in SECRET_FIELDS)
+REDACTED = "[redacted]"
+FORMATS = ("ndjson", "csv")
+
+# exports up to this size stay in memory, larger ones roll over to a temp file
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+
+@dataclass(slots=True)
+class ExportResult:
+    file: IO[bytes]          # gzip data, positioned at 0; caller closes it
+    filename: str
+    count: int
+    raw_bytes: int           # uncompressed size
+    preview: Optional[str]   # full uncompressed text if it fit in preview_limit, else None
+
+
+def iter_records(records: Iterable[VPSRecord], owner: Optional[int] = None,
+                 ip_range: Optional[str] = None, status: Optional[str] = None) -> Iterator[VPSRecord]:
+    network = ipaddress.ip_network(ip_range, strict=False) if ip_range else None
+    for rec in records:
+        if owner is not None and rec.owner != owner:
+            continue
+        if status is not None and (rec.status or "unknown") != status:
+            continue
+        if network is not None:
+            try:
+                if ipaddress.ip_address(rec.ip) not in network:
+                    continue
+            except ValueError:
+                continue
+        yield rec
+
+
+def project(rec: VPSRecord, fields: Sequence[str], reveal_secrets: bool = False) -> dict:
+    out = {}
+    for name in fields:
+        value = getattr(rec, name)
+        if name in SECRET_FIELDS and not reveal_secrets:
+            value = REDACTED if value else value
+        elif name == "shared_with":
+            value = sorted(value)
+        out[name] = value
+    return out
+
+
+class _CountingText(io.TextIOBase):
+    """
+    Text sink that forwards to a binary stream in ~64 KiB chunks (one small
+    compress() call per row is several times slower) and keeps a size-limited preview.
+    """
+
+    CHUNK = 64 * 1024
+
+    def __init__(self, raw: IO[bytes], preview_limit: int):
+        self.raw = raw
+        self.preview_limit = preview_limit
+        self.preview = io.StringIO()
+        self.bytes_written = 0
+        self._pending = []
+        self._pending_bytes = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, s: str) -> int:
+        data = s.encode("utf-8")
+        self._pending.append(data)
+        self._pending_bytes += len(data)
+        self.bytes_written += len(data)
+        if self._pending_bytes >= self.CHUNK:
+            self.flush()
+        if self.preview.tell() <= self.preview_limit:
+            self.preview.write(s)
+        return len(s)
+
+    def flush(self):
+        if self._pending:
+            self.raw.write(b"".join(self._pending))
+            self._pending = []
+            self._pending_bytes = 0
+
+
+def export_records(records: Iterable[VPSRecord], fmt: str = "ndjson",
+                   fields: Optional[Sequence[str]] = None, reveal_secrets: bool = False,
+                   preview_limit: int = 1900) -> ExportResult:
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    fields = tuple(fields or DEFAULT_FIELDS)
+    unknown = [f for f in fields if f not in ALL_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown field(s): {', '.join(unknown)}")
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    count = 0
+    with gzip.GzipFile(fileobj=spool, mode="wb") as gz:
+        out = _CountingText(gz, preview_limit)
+        if fmt == "csv":
+            writer = csv.writer(out)
+            writer.writerow(fields)
+            for rec in records:
+                row = project(rec, fields, reveal_secrets)
+                writer.writerow([" ".join(map(str, v)) if isinstance(v, list) else v for v in row.values()])
+                count += 1
+        else:
+            for rec in records:
+                out.write(json.dumps(project(rec, fields, reveal_secrets), separators=(",", ":")) + "\n")
+                count += 1
+        out.flush()
+    spool.seek(0)
+    preview = out.preview.getvalue() if out.bytes_written <= preview_limit else None
+    return ExportResult(file=spool, filename=f"vps_export.{fmt}.gz", count=count,
+                        raw_bytes=out.bytes_written, preview=preview)
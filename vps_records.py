@@ -0,0 +1,212 @@
+"""
+Typed VPS record layer shared by v2.py and v3.py.
+
+Both bots used to keep VPS entries as ad-hoc dicts with different schemas:
+- v2 (vps_db.json):   {"vps": [{"id", "name", "owner": int, "ip", "root_pass", "shared_with": [int]}]}
+- v3 (vps_data.json): {"1": {"name", "user": "123", "container", "ram", "cpu", "disk",
+                             "status", "shared_with": ["456"], "ssh_port"}}
+
+VPSStore reads either legacy layout (and the current one) into slotted
+VPSRecord objects with integer owners and `shared_with` as a set of ints, so
+permission checks are a constant-time membership test. Files are written back
+in the versioned layout {"schema": SCHEMA_VERSION, "vps": [...]}.
+"""
+
+import json
+import os
+import re
+import shutil
+import tempfile
+from dataclasses import MISSING, dataclass, field, fields
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Set
+
+SCHEMA_VERSION = 2
+
+_MENTION_RE = re.compile(r"<@!?(\d+)>")
+
+
+def parse_user_id(value) -> int:
+    """User id from an int, a numeric string or a Discord mention ("<@123>", "<@!123>")."""
+    if isinstance(value, int):
+        return value
+    text = str(value).strip()
+    match = _MENTION_RE.fullmatch(text)
+    return int(match.group(1) if match else text)
+
+
+def _parse_shared(values, vps_id: str) -> Set[int]:
+    shared = set()
+    for value in values or ():
+        try:
+            shared.add(parse_user_id(value))
+        except ValueError:
+            print(f"[!] VPS {vps_id}: ignoring unreadable shared_with entry {value!r}")
+    return shared
+
+
+@dataclass(slots=True)
+class VPSRecord:
+    id: str
+    name: str
+    owner: int
+    shared_with: Set[int] = field(default_factory=set)
+    ip: str = ""
+    root_pass: Optional[str] = None
+    container: str = ""          # container name (v3); v2 addresses containers by `id`
+    ram: int = 0
+    cpu: int = 0
+    disk: int = 0
+    ssh_port: int = 0
+    status: str = ""
+    plan: str = ""               # VPS_PLANS key when the VPS is billed (v3)
+    cpu_type: str = ""           # "intel" / "amd"
+
+    @property
+    def container_ref(self) -> str:
+        """Name or id to pass to docker_client.containers.get()."""
+        return self.container or self.id
+
+    def can_access(self, user_id: int) -> bool:
+        return user_id == self.owner or user_id in self.shared_with
+
+    def to_dict(self) -> dict:
+        # fields left at their default are omitted to keep the file small
+        out = {}
+        for name in _FIELD_NAMES:
+            value = getattr(self, name)
+            if name == "shared_with":
+                if value:
+                    out[name] = sorted(value)
+            elif name not in _DEFAULTS or value != _DEFAULTS[name]:
+                out[name] = value
+        return out
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "VPSRecord":
+        kwargs = {k: v for k, v in d.items() if k in _FIELD_NAMES}
+        kwargs["owner"] = parse_user_id(kwargs["owner"])
+        kwargs["shared_with"] = _parse_shared(kwargs.get("shared_with"), kwargs.get("id", "?"))
+        return cls(**kwargs)
+
+
+_FIELD_NAMES = tuple(f.name for f in fields(VPSRecord))
+_DEFAULTS = {f.name: f.default for f in fields(VPSRecord) if f.default is not MISSING}
+
+
+def _from_v2_entry(d: dict) -> VPSRecord:
+    return VPSRecord(
+        id=d["id"],
+        name=d["name"],
+        owner=parse_user_id(d["owner"]),
+        shared_with=_parse_shared(d.get("shared_with"), d["id"]),
+        ip=d.get("ip", ""),
+        root_pass=d.get("root_pass"),
+    )
+
+
+def _from_v3_entry(vps_id: str, d: dict) -> VPSRecord:
+    return VPSRecord(
+        id=vps_id,
+        name=d["name"],
+        owner=parse_user_id(d["user"]),
+        shared_with=_parse_shared(d.get("shared_with"), vps_id),
+        container=d.get("container", ""),
+        ram=d.get("ram", 0),
+        cpu=d.get("cpu", 0),
+        disk=d.get("disk", 0),
+        ssh_port=d.get("ssh_port", 0),
+        status=d.get("status", ""),
+    )
+
+
+class VPSStore:
+    """In-memory index of VPSRecords backed by a JSON file."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.records: Dict[str, VPSRecord] = {}
+        # bumped on every add/remove/save so callers can cheaply detect changes
+        self.revision = 0
+        self.load()
+
+    def load(self):
+        self.records = {}
+        if not self.path.exists():
+            return
+        raw = json.loads(self.path.read_text() or "{}")
+        if "schema" in raw:
+            if raw["schema"] > SCHEMA_VERSION:
+                raise ValueError(f"{self.path} has schema {raw['schema']}, newer than supported {SCHEMA_VERSION}")
+            entries = [(VPSRecord.from_dict, (d,)) for d in raw.get("vps", [])]
+        elif isinstance(raw.get("vps"), list):
+            entries = [(_from_v2_entry, (d,)) for d in raw["vps"]]
+        else:
+            entries = [(_from_v3_entry, (k, d)) for k, d in raw.items()]
+        skipped = 0
+        for convert, args in entries:
+            try:
+                rec = convert(*args)
+            except (KeyError, TypeError, ValueError) as e:
+                # one bad legacy entry must not keep the bot from starting
+                print(f"[!] {self.path}: skipping unreadable VPS entry {args[0]!r}: {e!r}")
+                skipped += 1
+                continue
+            self.records[rec.id] = rec
+        if skipped:
+            # the next save() drops skipped entries; keep the original file for manual recovery
+            backup = self.path.with_name(self.path.name + ".unreadable.bak")
+            if not backup.exists():
+                shutil.copyfile(self.path, backup)
+                print(f"[!] {self.path}: original saved as {backup}")
+
+    def save(self):
+        payload = {"schema": SCHEMA_VERSION, "vps": [r.to_dict() for r in self.records.values()]}
+        text = json.dumps(payload, separators=(",", ":"))
+        # write-then-rename so a crash never leaves a half-written DB
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent or ".", prefix=self.path.name, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(text)
+            os.replace(tmp, self.path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        self.revision += 1
+
+    def __iter__(self) -> Iterator[VPSRecord]:
+        return iter(list(self.records.values()))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, vps_id: str) -> bool:
+        return vps_id in self.records
+
+    def get(self, vps_id: str) -> Optional[VPSRecord]:
+        return self.records.get(vps_id)
+
+    def find(self, id_or_prefix: str) -> Optional[VPSRecord]:
+        """Exact id match, else the first record whose id starts with the prefix."""
+        rec = self.records.get(id_or_prefix)
+        if rec is not None:
+            return rec
+        for vps_id, rec in self.records.items():
+            if vps_id.startswith(id_or_prefix):
+                return rec
+        return None
+
+    def add(self, rec: VPSRecord):
+        self.records[rec.id] = rec
+        self.revision += 1
+
+    def remove(self, vps_id: str) -> Optional[VPSRecord]:
+        rec = self.records.pop(vps_id, None)
+        if rec is not None:
+            self.revision += 1
+        return rec
+
+    def next_id(self) -> str:
+        """Next numeric id (v3 style). Unlike len()+1 this never reuses a live id."""
+        numeric = [int(k) for k in self.records if k.isdigit()]
+        return str(max(numeric, default=0) + 1)